@@ -0,0 +1,201 @@
+# Copyright 2011 MIT Haystack Observatory
+#
+# This file is part of Mark6 / 5C.
+#
+# Mark6 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2 of the License.
+#
+# Mark6 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Mark6.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+A columnar table of the scans of a VEX schedule.
+
+The scans are kept in a NumPy structured array with one record per scan
+(start epoch, duration, source index) plus a (scans, stations) array of
+the recording durations. Questions like "which scans
+of station X have not ended yet", "do any scans overlap" or "how long
+are the gaps" are answered by vectorized queries.
+"""
+
+import re
+import time
+import numpy as np
+
+scan_dtype = np.dtype([
+        ('start', 'f8'),        # scan start [s since 1970]
+        ('duration', 'i4'),     # longest recording duration of the scan [s]
+        ('source', 'i4'),       # index into ScanTable.sources
+])
+
+_vex_time = re.compile(r'(\d+)y(\d+)d(\d+)h(\d+)m(\d+)s')
+
+
+def vex_epochs(times):
+        """
+        Converts VEX times (e.g. 2015y080d05h00m00s) into seconds since
+        1970.
+        """
+
+        fields = np.array([_vex_time.match(t).groups() for t in times], dtype=np.int64).reshape(-1, 5)
+        days = (fields[:, 0] - 1970).astype('datetime64[Y]').astype('datetime64[D]').astype(np.int64) + fields[:, 1] - 1
+
+        return (days * 86400 + fields[:, 2] * 3600 + fields[:, 3] * 60 + fields[:, 4]).astype(np.float64)
+
+
+class ScanTable:
+        """
+        scans      structured array (see scan_dtype)
+        durations  recording durations [s] of every scan and station, 0 if
+                   the station does not take part
+        stations   station codes, the column order of durations and the
+                   bit order of station_masks()
+        sources    source names
+        names      scan names
+        """
+
+        def __init__(self, scans, durations, stations, sources, names):
+
+                self.scans = scans
+                self.durations = durations
+                self.stations = list(stations)
+                self.sources = list(sources)
+                self.names = list(names)
+
+        @classmethod
+        def from_vex(cls, vex):
+                """
+                Builds the table from a parsed VexFile.
+                """
+
+                # in the order of appearance in the VEX file
+                stations = list(vex.stations)
+                durations = np.zeros((len(vex), len(stations)), dtype=np.int32)
+                for col, st in enumerate(stations):
+                        station_scans = vex.stations[st]
+                        durations[np.asarray(station_scans.scan_idx, dtype=np.int64), col] = station_scans.durations
+
+                scans = np.zeros(len(vex), dtype=scan_dtype)
+                scans['start'] = vex_epochs(vex.scan_starts)
+                scans['duration'] = durations.max(axis=1) if len(stations) else 0
+                scans['source'] = vex.scan_sources
+
+                return cls(scans, durations, stations, vex.sources, vex.scan_names)
+
+        def __len__(self):
+                return len(self.scans)
+
+        def station_masks(self):
+                """
+                Returns the stations taking part in each scan as a uint64
+                bit mask (bit i set for self.stations[i]). Only available for
+                schedules with up to 64 stations.
+                """
+
+                if len(self.stations) > 64:
+                        raise ValueError("The station mask is limited to 64 stations")
+
+                bits = np.left_shift(np.uint64(1), np.arange(len(self.stations), dtype=np.uint64))
+                return np.bitwise_or.reduce(np.where(self.durations > 0, bits, np.uint64(0)), axis=1, initial=np.uint64(0))
+
+        def station_durations(self, st, equiv_map=None):
+                """
+                Returns the recording durations of station st for all scans
+                (0 if it does not take part). Scans without st are filled in
+                from stations mapped to st by equiv_map; if several of them
+                take part, the one appearing last in the VEX file wins.
+                """
+
+                equiv_map = equiv_map or {}
+                result = np.zeros(len(self), dtype=np.int32)
+                for col, code in enumerate(self.stations):
+                        if code != st and equiv_map.get(code) == st:
+                                d = self.durations[:, col]
+                                result = np.where(d > 0, d, result)
+                if st in self.stations:
+                        d = self.durations[:, self.stations.index(st)]
+                        result = np.where(d > 0, d, result)
+
+                return result
+
+        def select(self, st=None, equiv_map=None):
+                """
+                Returns a boolean mask of the scans of station st (all scans
+                if st is None).
+                """
+
+                if st is None:
+                        return np.ones(len(self), dtype=bool)
+                return self.station_durations(st, equiv_map) > 0
+
+        def ends(self, st=None, equiv_map=None):
+                """
+                Returns the end times [s since 1970] of the scans, using the
+                recording durations of station st if given.
+                """
+
+                if st is None:
+                        return self.scans['start'] + self.scans['duration']
+                return self.scans['start'] + self.station_durations(st, equiv_map)
+
+        def late(self, now=None, st=None, equiv_map=None):
+                """
+                Returns a boolean mask of the scans that have ended at time
+                now (default: the current time).
+                """
+
+                if now is None:
+                        now = time.time()
+                return self.ends(st, equiv_map) < now
+
+        def future(self, now=None, st=None, equiv_map=None):
+                """
+                Returns the indices of the scans (of station st) that have not
+                ended yet.
+                """
+
+                return np.flatnonzero(self.select(st, equiv_map) & ~self.late(now, st, equiv_map))
+
+        def _ordered(self, st, equiv_map):
+
+                idx = np.flatnonzero(self.select(st, equiv_map))
+                idx = idx[np.argsort(self.scans['start'][idx], kind='stable')]
+                return idx, self.scans['start'][idx], self.ends(st, equiv_map)[idx]
+
+        def overlaps(self, st=None, equiv_map=None):
+                """
+                Returns the pairs of consecutive scans (of station st) that
+                overlap in time as an array of shape (n, 2) of scan indices.
+                """
+
+                idx, start, end = self._ordered(st, equiv_map)
+                clash = np.flatnonzero(start[1:] < end[:-1])
+
+                return np.column_stack((idx[clash], idx[clash + 1]))
+
+        def gaps(self, st=None, equiv_map=None):
+                """
+                Returns the gaps [s] between the end of a scan and the start of
+                the next scan (of station st). Overlaps are negative.
+                """
+
+                idx, start, end = self._ordered(st, equiv_map)
+                return start[1:] - end[:-1]
+
+        def gap_stats(self, st=None, equiv_map=None):
+                """
+                Returns the number, minimum, median, mean and maximum of the
+                gaps as a dict.
+                """
+
+                g = self.gaps(st, equiv_map)
+                if len(g) == 0:
+                        return {'count': 0, 'min': None, 'median': None, 'mean': None, 'max': None}
+
+                return {'count': len(g), 'min': float(g.min()), 'median': float(np.median(g)), 'mean': float(g.mean()), 'max': float(g.max())}
@@ -1,4 +1,4 @@
-#!/usr/bin/python
+#!/usr/bin/env python3
 
 # Copyright 2011 MIT Haystack Observatory
 # 
@@ -30,6 +30,11 @@ import sys
 import os
 import string
 
+import numpy as np
+
+from vexparse import VexFile, ScanCache
+from scantable import ScanTable
+
 class Station:
     station_dict = {
         #st    LCP/low    st    LCP/upper  st    RCP/lower  st    RCP/upper
@@ -50,6 +55,29 @@ class Station:
         'H1': 'Hi', 'H2': 'Hi', 'H3': 'Hi', 'H4': 'Hi'
     }
 
+def is_vex(schedule_file):
+        # VEX files start with the VEX_rev statement
+        input_file = open(schedule_file, 'r')
+        first = input_file.readline()
+        input_file.close()
+        return first.lstrip().startswith('VEX')
+
+def report_changes(vex, max_names=20):
+        # the scans added, removed or changed since the last run
+        if vex.parsed_scans == len(vex):
+                print("Parsed all %d scans" % len(vex))
+        else:
+                print("Parsed %d of %d scans, the others were cached" % (vex.parsed_scans, len(vex)))
+        if vex.diff is None:
+                print()
+                return
+        for kind in ('added', 'removed', 'changed'):
+                names = vex.diff[kind]
+                if names:
+                        more = " ..." if len(names) > max_names else ""
+                        print("%d scans %s: %s%s" % (len(names), kind, " ".join(names[:max_names]), more))
+        print()
+
 def parse_time(t):
         st = t[:t.find("y")] \
              + t[t.find("y")+1:t.find("d")] \
@@ -120,7 +148,95 @@ class Scan:
 class ScheduleParser:
 
         def __init__(self,
-            schedule_file, experiment_file_name, experiment_name, st):
+            schedule_file, experiment_file_name, experiment_name, st,
+            now=None, check=False, cache=None):
+                # now: only schedule the scans that have not ended at this
+                # time [s since 1970]. check: report gaps and overlaps.
+                # cache: a vexparse.ScanCache of the parsed scans
+                if is_vex(schedule_file):
+                        scans, exp_start_time, exp_end_time = self.parse_vex(
+                            schedule_file, experiment_name, st, now, check, cache)
+                else:
+                        scans, exp_start_time, exp_end_time = self.parse_legacy(
+                            schedule_file, experiment_name, st)
+
+                if not self.write(experiment_file_name, experiment_name, st,
+                    scans, exp_start_time, exp_end_time):
+                        print("%s is unchanged" % experiment_file_name)
+
+        def parse_vex(self, schedule_file, experiment_name, st,
+            now=None, check=False, cache=None):
+                # single pass over the file, see vexparse
+                vex = self.vex_file(schedule_file, cache)
+                table = ScanTable.from_vex(vex)
+
+                exp_start_time, exp_end_time = self.vex_exper_times(vex)
+                print("exp_start_time is:", exp_start_time)
+                print("exp_end_time is:  ", exp_end_time)
+                print()
+
+                scans = self.vex_scans(vex, table, experiment_name, st, now=now)
+                if check:
+                        self.vex_check(table, st)
+
+                return scans, exp_start_time, exp_end_time
+
+        def vex_file(self, schedule_file, cache=None):
+                vex = VexFile(schedule_file, cache)
+                if cache is not None:
+                        cache.save()
+                        report_changes(vex)
+                return vex
+
+        def vex_exper_times(self, vex):
+                exp_start_time=exp_end_time="0"
+                if 'exper_nominal_start' in vex.exper:
+                        exp_start_time = parse_time(vex.exper['exper_nominal_start'])
+                if 'exper_nominal_stop' in vex.exper:
+                        exp_end_time = parse_time(vex.exper['exper_nominal_stop'])
+
+                return exp_start_time, exp_end_time
+
+        def vex_scans(self, vex, table, experiment_name, st,
+            verbose=True, start_times=None, now=None):
+                # the scans of station st (or of its equivalent stations).
+                # start_times are the parsed start times of all scans, if known
+                durations = table.station_durations(st, Station.equiv_map)
+                selected = durations > 0
+                if now is not None:
+                        selected &= ~table.late(now, st, Station.equiv_map)
+                scans = []
+                # without the log only the selected scans are visited
+                for idx in (range(len(vex)) if verbose else np.flatnonzero(selected)):
+                        sname, t, source = vex.scan(idx)
+                        start_time = start_times[idx] if start_times else parse_time(t)
+                        ddd = t[t.find("y")+1:t.find("d")]
+                        if selected[idx]:
+                                if verbose:
+                                        print("At", start_time, "on %-10s" % (source), end=' ')
+                                        print("for %ss at %s." % (durations[idx], st))
+                                scans.append( Scan(experiment_name, source, st, start_time, durations[idx], ddd, sname) )
+                        elif verbose and durations[idx] > 0:
+                                print("At", start_time, "on %-10s" % (source), end=' ')
+                                print("Scan %s has already ended" % (sname))
+                        elif verbose:
+                                print("At", start_time, "on %-10s" % (source), end=' ')
+                                print("No duration for scan %s at %s" % (sname,start_time))
+
+                return scans
+
+        def vex_check(self, table, st):
+                # gap statistics and overlapping scans of station st
+                stats = table.gap_stats(st, Station.equiv_map)
+                if stats['count'] > 0:
+                        print("%-3s gaps [s]: min %d median %d mean %.1f max %d" % (
+                            st, stats['min'], stats['median'], stats['mean'], stats['max']))
+                for first, second in table.overlaps(st, Station.equiv_map):
+                        print("%-3s scan %s overlaps scan %s" % (
+                            st, table.names[first], table.names[second]))
+
+        def parse_legacy(self, schedule_file, experiment_name, st):
+                # line based parser, used for SKD files
                 input_file = open(schedule_file, 'r')
 
                 dlist = {}
@@ -169,7 +285,7 @@ class ScheduleParser:
 
                         if state == 1:
                                 source, t, stations = f[0], f[4], f[9] 
-                                num_stations = len(stations)/2
+                                num_stations = len(stations)//2
                                 offset = 9 + num_stations
                                 durations = f[offset+2:]
                                 stations = list(stations)
@@ -229,7 +345,7 @@ class ScheduleParser:
                                                                         start_time = parse_time(t)
 
                                                                         #print "starttime set to ", start_time
-                                                                        print "At", start_time,
+                                                                        print("At", start_time, end=' ')
 
                                                                         ddd = t[t.find("y")+1:t.find("d")]
                                                                         #print "(DOY %s)" % (ddd),
@@ -238,7 +354,7 @@ class ScheduleParser:
                                                                         #print "found source", f[j][f[j].find('=')+1:]
                                                                         #print "on", f[j][f[j].find('=')+1:-1],
                                                                         source = f[j][f[j].find('=')+1:-1]
-                                                                        print "on %-10s" % (source),
+                                                                        print("on %-10s" % (source), end=' ')
                                                                 elif val == "station":
                                                                         #print "found station while looking for ", st
                                                                         proc_st = f[j][f[j].find('=')+1:f[j].find(':')]
@@ -254,11 +370,11 @@ class ScheduleParser:
                                                                                 duration = f[3]
                                                                                 #print "duration of recording is ", duration,
                                                                                 #print "for %ss." % duration
-                                                                                print "for %ss at %s." % (duration,proc_st)
+                                                                                print("for %ss at %s." % (duration,proc_st))
                                                                                 
                                                                         elif equivst == st:
                                                                                 equivdur = f[3]
-                                                                                print "for %ss at %s." % (equivdur,equivst)
+                                                                                print("for %ss at %s." % (equivdur,equivst))
                                                                 
                                                 #else:
                                                 #       print "do nothing"
@@ -282,12 +398,12 @@ class ScheduleParser:
                                 #stations = f[9]
                                 #print "end of while loop"
                                 cnt += 1
-                                if (duration > 0):
+                                if (int(duration) > 0):
                                     scans.append( Scan(experiment_name, source, st, start_time, duration, ddd, sname) )
-                                elif (equivdur > 0):
+                                elif (int(equivdur) > 0):
                                     scans.append( Scan(experiment_name, source, st, start_time, equivdur, ddd, sname) )
                                 else:
-                                    print "No duration for scan %s at %s" % (sname,start_time)
+                                    print("No duration for scan %s at %s" % (sname,start_time))
 
                         elif state == 5:
                                 #print "station is %s state 5" % (st)
@@ -329,21 +445,21 @@ class ScheduleParser:
                                                                         t = f[j][f[j].find('=')+1:]
                                                                         start_time = ts_parse(t)
                                                                         
-                                                                        print "starttime set to ", start_time
+                                                                        print("starttime set to ", start_time)
 
                                                                         ddd = t[t.find("y")+1:t.find("d")]
-                                                                        print "ddd is ", ddd
+                                                                        print("ddd is ", ddd)
                                                                         
                                                                 elif val == "exper_nominal_start":
                                                                         #print "found nominal_start", f[j][f[j].find('=')+1:]
                                                                         exp_start_time=parse_time(f[j][f[j].find('=')+1:])
-                                                                        print"exp_start_time is:", exp_start_time
+                                                                        print("exp_start_time is:", exp_start_time)
 
                                                                 elif val == "exper_nominal_stop":
                                                                         #print "found nominal_stop ",  f[j][f[j].find('=')+1:]
                                                                         exp_end_time=parse_time(f[j][f[j].find('=')+1:])
-                                                                        print"exp_end_time is:  ", exp_end_time
-                                                                        print
+                                                                        print("exp_end_time is:  ", exp_end_time)
+                                                                        print()
                                                                 
                                                 #else:
                                                 #       print "do nothing"
@@ -368,14 +484,19 @@ class ScheduleParser:
                         else:
                                 cnt +=1
                                 state = 0
-                        
+
+                return scans, exp_start_time, exp_end_time
+
+        def write(self, experiment_file_name, experiment_name, st,
+            scans, exp_start_time, exp_end_time):
+                # returns False if the file exists with the same contents
                 st_scans = [ s for s in scans]
-                experiment_file = open(experiment_file_name, 'w')
+                lines = []
 
                 exp_st = '<experiment name="' + experiment_name
                 exp_st += '" station="' +st + '" start="' +exp_start_time + '" '
                 exp_st += ' end="' + exp_end_time +'"> \n'
-                experiment_file.write(exp_st)
+                lines.append(exp_st)
                 try:
                     rdbe_ip = os.environ['rdbe']
                 except:
@@ -390,8 +511,59 @@ class ScheduleParser:
                 #experiment_file.write('\t' + config_st + '\n')
                 #commented out for EHT run Jan 2015
                 for s in st_scans:
-                        experiment_file.write('\t' + str(s) + '\n')
-                experiment_file.write('</experiment>\n')
+                        lines.append('\t' + str(s) + '\n')
+                lines.append('</experiment>\n')
+
+                # leave an unchanged schedule untouched (e.g. its time stamp)
+                content = ''.join(lines)
+                if os.path.isfile(experiment_file_name):
+                        with open(experiment_file_name, 'r') as experiment_file:
+                                if experiment_file.read() == content:
+                                        return False
+                with open(experiment_file_name, 'w') as experiment_file:
+                        experiment_file.write(content)
+                return True
+
+class MultiScheduleParser(ScheduleParser):
+        """
+        Parses a VEX file once and writes the schedules of several
+        stations to <fn_base>_<st>.xml. By default all stations of the
+        $SCHED block and the stations they are equivalent to (equiv_map)
+        are scheduled.
+        """
+
+        def __init__(self,
+            schedule_file, fn_base, experiment_name, stations=None,
+            now=None, check=False, cache=None):
+                if not is_vex(schedule_file):
+                        raise ValueError("%s is not a VEX file" % schedule_file)
+
+                vex = self.vex_file(schedule_file, cache)
+                table = ScanTable.from_vex(vex)
+                exp_start_time, exp_end_time = self.vex_exper_times(vex)
+
+                if stations is None:
+                        stations = set(vex.stations)
+                        for st in vex.stations:
+                                if st in Station.equiv_map:
+                                        stations.add(Station.equiv_map[st])
+                        stations = sorted(stations)
+
+                # the start times are shared by all stations: parse them once
+                start_times = [parse_time(t) for t in vex.scan_starts]
+
+                self.files = {}
+                for st in stations:
+                        scans = self.vex_scans(vex, table, experiment_name, st,
+                            verbose=False, start_times=start_times, now=now)
+                        fn_out = "%s_%s.xml" % (fn_base, st)
+                        written = self.write(fn_out, experiment_name, st,
+                            scans, exp_start_time, exp_end_time)
+                        self.files[st] = fn_out
+                        print("%-3s %5d scans -> %s%s" % (st, len(scans), fn_out,
+                            "" if written else " (unchanged)"))
+                        if check:
+                                self.vex_check(table, st)
 
 if __name__ == '__main__':
 
@@ -403,6 +575,13 @@ if __name__ == '__main__':
           -s <XX>       the two letter station code to schedule
           -n <string>   site name of this station code
           -e <YY>       declares XX equivalent to YY
+          -a            schedule all stations of the vex file in one pass,
+                        writing one <expt>_<XX>.xml file per station
+          -u            only schedule the scans that have not ended yet (VEX only)
+          -c            report the gaps between and overlaps of the scans (VEX only)
+          -N            do not use the cache of the parsed scans. By default
+                        the scans are cached in .<file>.scancache and a re-run
+                        only parses the scans that changed (VEX only)
 
         Normally,
 
@@ -419,12 +598,17 @@ if __name__ == '__main__':
           vex2xml.py -f apr04b.new -s Az -e AZ
 
         should recreate apr04b.xml
+
+          vex2xml.py -f expt.vex -a
+
+        writes the schedules of all stations (including the equivalent
+        stations, e.g. Az for A1..A4) from a single parse of expt.vex.
         """
 
         parms = {'-f':"test.vex", '-s': 'Xx', '-n':"site-name", '-e':"Yy"}
         try:
-                opts, pargs = getopt.getopt(sys.argv[1:], "f:s:n:e:")
-        except getopt.GetoptError, msg:
+                opts, pargs = getopt.getopt(sys.argv[1:], "acuNf:s:n:e:")
+        except getopt.GetoptError as msg:
                 sys.exit(msg)
                 
         for o,v in opts:
@@ -434,37 +618,55 @@ if __name__ == '__main__':
         input_st = str(parms['-s'])
         input_sn = str(parms['-n'])
         input_eq = str(parms['-e'])
-
-        # --- VERIFY STATION EXISTS IN STATION LIST
-        if Station.station_dict.has_key(input_st):
-                station = input_st
-                print "Processing station -> %s" % (station)            
-        else:
-                Station.station_dict.update({input_st : input_sn})
-                station = input_st
-                print "Adding&using station -> %s (%s)" % (station, input_sn)
-
-        # --- ADD Equivalence for input station
-        if Station.station_dict.has_key(input_eq):
-                Station.equiv_map.update({input_eq : input_st})
-                print "Treating %s like %s" % (input_eq,Station.equiv_map[input_eq])
-        else:
-                print "Unable to treat %s like %s" % (input_eq,input_st)
+        parms_given = dict(opts)
+        all_stations = '-a' in parms_given
+        check = '-c' in parms_given
+        now = time.time() if '-u' in parms_given else None
+        use_cache = '-N' not in parms_given
+
+        # --- with -a only a station given by -s needs to be added
+        if not all_stations or '-s' in parms_given:
+                # --- VERIFY STATION EXISTS IN STATION LIST
+                if input_st in Station.station_dict:
+                        station = input_st
+                        print("Processing station -> %s" % (station))            
+                else:
+                        Station.station_dict.update({input_st : input_sn})
+                        station = input_st
+                        print("Adding&using station -> %s (%s)" % (station, input_sn))
+
+                # --- ADD Equivalence for input station
+                if input_eq in Station.station_dict:
+                        Station.equiv_map.update({input_eq : input_st})
+                        print("Treating %s like %s" % (input_eq,Station.equiv_map[input_eq]))
+                else:
+                        print("Unable to treat %s like %s" % (input_eq,input_st))
 
         # --- test if file exists
         if os.path.isfile(input_fn):
                 start_pos = input_fn.rfind("/")
                 exp = input_fn[start_pos+1:input_fn.find(".")]
+                cache = ScanCache.for_vex(input_fn) if use_cache else None
+
+                if all_stations:
+                        print("Parsing VEX file %s for %s at all stations.\n" % (input_fn, exp))
+                        try:
+                                sp = MultiScheduleParser(input_fn, input_fn[:input_fn.find(".")], exp,
+                                    now=now, check=check, cache=cache)
+                        except ValueError as msg:
+                                sys.exit(msg)
+                        sys.exit(0)
+
                 fn_out = input_fn[:input_fn.find(".")] + ".xml"
-                print "Output filename is %s" % (fn_out)
+                print("Output filename is %s" % (fn_out))
 
                 # --- GET EXPERIMENT NAME
 
-                print "Parsing VEX file %s for %s at %s.\n" % (input_fn, exp, station)
-                sp = ScheduleParser(input_fn, fn_out, exp, station)
+                print("Parsing VEX file %s for %s at %s.\n" % (input_fn, exp, station))
+                sp = ScheduleParser(input_fn, fn_out, exp, station, now, check, cache)
         else:
-                print"Input file %s does not exist" % (input_fn)
-                print helpstring
+                print("Input file %s does not exist" % (input_fn))
+                print(helpstring)
                 exit
 
 #
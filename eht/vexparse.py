@@ -0,0 +1,567 @@
+# Copyright 2011 MIT Haystack Observatory
+#
+# This file is part of Mark6 / 5C.
+#
+# Mark6 is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2 of the License.
+#
+# Mark6 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Mark6.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Single pass parser for VEX schedules.
+
+The file is read once, statement by statement, without keeping its
+contents in memory. While reading, an index of the byte offsets of all
+blocks ($EXPER, $SCHED, ...), their defs and the scans is built, so any
+part of the file can be read again later with statements(). The $EXPER
+parameters and the scans of the $SCHED block are kept:
+
+  - one entry per scan with its name, start time and source (sources are
+    stored once and referenced by index)
+  - per station: the indices of the scans it takes part in and its
+    recording durations, as compact integer arrays
+
+With a ScanCache the scans are split at the endscan statements and only
+scans whose text is not found in the cache are parsed; the differences to
+the previous run are reported in VexFile.diff.
+
+Works with python 2 and 3.
+"""
+
+import gc
+import io
+import os
+import re
+import mmap
+import json
+import hashlib
+import itertools
+import tempfile
+import contextlib
+from array import array
+
+_text = type(u'')
+# type(2**64) is long in python 2
+_integer = (int, type(2**64))
+
+_sched_block = re.compile(br'^[ \t]*\$SCHED[ \t]*;', re.M)
+_statement_end = re.compile(br'\s*;')
+
+
+def tokenize(f, offset=0):
+        """
+        Yields the statements of an open (binary) VEX file as (offset,
+        statement) tuples. offset is the byte offset of the start of the
+        statement. Comments and the surrounding white space are removed,
+        statements spanning several lines are joined into one line.
+        """
+
+        parts = []
+        start = None
+        for raw in f:
+                # latin-1 maps every byte to one character: the offsets stay byte offsets
+                line = raw.decode('latin-1')
+                comment = line.find('*')
+                if comment >= 0:
+                        line = line[:comment]
+
+                pieces = line.split(';')
+                pos = offset
+                for piece in pieces[:-1]:
+                        if parts:
+                                parts.append(piece)
+                                yield start, ' '.join(''.join(parts).split())
+                                parts = []
+                        else:
+                                statement = piece.strip()
+                                if statement:
+                                        yield pos + len(piece) - len(piece.lstrip()), statement
+                        pos += len(piece) + 1
+
+                # the start of a statement continued on the next line
+                rest = pieces[-1]
+                if parts or rest.strip():
+                        if not parts:
+                                start = pos + len(rest) - len(rest.lstrip())
+                        parts.append(rest)
+
+                offset += len(raw)
+
+def split_assignment(statement):
+        """
+        Splits a 'key = value' statement. Returns (key, value) or
+        (statement, None) if it is not an assignment.
+        """
+
+        eq = statement.find('=')
+        if eq < 0:
+                return statement, None
+        return statement[:eq].strip(), statement[eq+1:].strip()
+
+def seconds(value):
+        """
+        Returns the number of seconds of a VEX duration e.g. '600 sec'.
+        """
+
+        fields = value.split()
+        if not fields:
+                return 0
+        return int(float(fields[0]))
+
+
+def _scan_ends(data, pos=0):
+        """
+        Yields the offsets following the endscan statements of the VEX
+        text data from pos on. endscan in comments or as part of a longer
+        word is skipped. Plain searches are several times faster than a
+        regular expression for this.
+        """
+
+        while True:
+                start = data.find(b'endscan', pos)
+                if start < 0:
+                        return
+                pos = start + len(b'endscan')
+                line = data.rfind(b'\n', 0, start) + 1
+                if data.find(b'*', line, start) >= 0:
+                        continue
+                if start > line and (data[start-1:start].isalnum() or data[start-1:start] == b'_'):
+                        continue
+                end = _statement_end.match(data, pos)
+                if end is not None:
+                        pos = end.end()
+                        yield pos
+
+@contextlib.contextmanager
+def _gc_paused():
+        """
+        Disables the garbage collector: the scan cache holds millions of
+        small (acyclic) objects that it would otherwise scan repeatedly
+        while they are created.
+        """
+
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+                yield
+        finally:
+                if enabled:
+                        gc.enable()
+
+
+def new_scan(name, offset):
+        return {'name': name, 'offset': offset, 'start': None, 'source': None, 'stations': []}
+
+def scan_parameter(scan, statement):
+        """
+        Adds a statement of a scan definition to scan. Returns True at the
+        end of the scan.
+        """
+
+        key, value = split_assignment(statement)
+        if key == 'station' and value is not None:
+                fields = value.split(':', 3)
+                if len(fields) > 2:
+                        scan['stations'].append((fields[0].strip(), seconds(fields[2])))
+        elif key == 'start':
+                scan['start'] = value
+        elif key == 'source':
+                scan['source'] = value
+        elif statement == 'endscan':
+                return True
+        return False
+
+def parse_scan(statements):
+        """
+        Parses the statements of a single scan definition. Returns the scan
+        or None if there is no complete scan.
+        """
+
+        scan = None
+        for offset, statement in statements:
+                if scan is None:
+                        words = statement.split(None, 1)
+                        if words[0] == 'scan' and len(words) > 1:
+                                scan = new_scan(words[1], offset)
+                elif scan_parameter(scan, statement):
+                        return scan
+        return None
+
+
+class ScanCache:
+        """
+        Parsed scan definitions keyed by the SHA-1 digest of their text,
+        kept between runs in a file (by default a hidden file next to the
+        VEX file). A VEX file re-issued with a few modified scans only
+        needs these scans to be parsed again.
+
+        The scans are handled as (name, offset, start, source, stations)
+        tuples, offset being relative to the start of the scan text. The
+        file is plain JSON, so loading it cannot execute code (VEX files
+        often live in shared directories). It holds one column per field
+        of the scans of the last run, the station codes of a scan as one
+        space separated string, and the scans are only turned into tuples
+        when used.
+        """
+
+        columns = ('names', 'digests', 'offsets', 'starts', 'sources', 'stations', 'durations')
+        column_types = {
+                'names': (_text,), 'digests': (_text,), 'offsets': _integer,
+                'starts': (_text, type(None)), 'sources': (_text, type(None)),
+                'stations': (_text,), 'durations': (list,),
+        }
+
+        def __init__(self, path):
+
+                self.path = path
+                self.scans = {}
+                self.names = []
+                self.used = set()
+                self.dirty = False
+                self._columns = None
+                self._index = {}
+                try:
+                        with open(path, 'r') as f, _gc_paused():
+                                columns = json.load(f)
+                        if not self._valid(columns):
+                                raise ValueError("inconsistent scan cache")
+                        self._columns = columns
+                        self._index = dict(zip(columns['digests'], range(len(columns['digests']))))
+                        self.names = list(zip(columns['names'], columns['digests']))
+                except (IOError, OSError, ValueError, TypeError, KeyError, AttributeError):
+                        # no cache yet, or an unreadable one
+                        self._columns = None
+                        self._index = {}
+                        self.names = []
+
+        @classmethod
+        def _valid(cls, columns):
+                """
+                Checks the columns read from the cache file: a damaged or
+                foreign file must not turn up later as broken scans.
+                """
+
+                if not isinstance(columns, dict) or not all(isinstance(columns.get(key), list) for key in cls.columns):
+                        return False
+                if len(set(len(columns[key]) for key in cls.columns)) != 1:
+                        return False
+
+                # the start and source of a scan may be missing (null)
+                for key, types in cls.column_types.items():
+                        if not set(map(type, columns[key])) <= set(types):
+                                return False
+                durations = columns['durations']
+                if [len(codes.split()) for codes in columns['stations']] != list(map(len, durations)):
+                        return False
+                if not set(map(type, itertools.chain.from_iterable(durations))) <= set(_integer):
+                        return False
+
+                return True
+
+        @classmethod
+        def for_vex(cls, vex_file):
+                head, tail = os.path.split(vex_file)
+                return cls(os.path.join(head, ".%s.scancache" % tail))
+
+        def _cached(self, digest):
+                scan = self.scans.get(digest)
+                if scan is None and digest in self._index:
+                        i = self._index[digest]
+                        columns = self._columns
+                        stations = tuple(zip(columns['stations'][i].split(), columns['durations'][i]))
+                        scan = (columns['names'][i], columns['offsets'][i], columns['starts'][i], columns['sources'][i], stations)
+                        self.scans[digest] = scan
+                return scan
+
+        def get(self, digest):
+                scan = self._cached(digest)
+                if scan is not None:
+                        self.used.add(digest)
+                return scan
+
+        def put(self, digest, scan):
+                self.scans[digest] = scan
+                self.used.add(digest)
+                self.dirty = True
+
+        def update(self, names):
+                """
+                Stores the (name, digest) pairs of the scans of the current
+                run. Returns the differences to the previous run as a dict of
+                name lists: added, removed and changed, or None if there was
+                no previous run. Changes of comments or formatting only are
+                not reported.
+                """
+
+                def contents(digest):
+                        scan = self._cached(digest)
+                        return scan[2:] if scan else None
+
+                if not self.names:
+                        # first use of the cache: nothing to compare with
+                        self.names = list(names)
+                        self.dirty = True
+                        return None
+
+                previous = dict(self.names)
+                current = dict(names)
+                diff = {
+                        'added': [name for name, digest in names if name not in previous],
+                        'removed': [name for name, digest in self.names if name not in current],
+                        'changed': [name for name, digest in names if name in previous and previous[name] != digest and contents(previous[name]) != contents(digest)],
+                }
+                if names != self.names:
+                        self.names = list(names)
+                        self.dirty = True
+
+                return diff
+
+        def save(self):
+                # only keep the scans of the last run
+                if self.used != set(self._index):
+                        self.dirty = True
+                if not self.dirty:
+                        return
+
+                scans = [self._cached(digest) for name, digest in self.names]
+                columns = {
+                        'names': [scan[0] for scan in scans],
+                        'digests': [digest for name, digest in self.names],
+                        'offsets': [scan[1] for scan in scans],
+                        'starts': [scan[2] for scan in scans],
+                        'sources': [scan[3] for scan in scans],
+                        'stations': [' '.join([code for code, duration in scan[4]]) for scan in scans],
+                        'durations': [[duration for code, duration in scan[4]] for scan in scans],
+                }
+
+                head = os.path.dirname(self.path) or '.'
+                try:
+                        fd, tmp = tempfile.mkstemp(dir=head, prefix='.scancache.')
+                        with os.fdopen(fd, 'w') as f:
+                                json.dump(columns, f, separators=(',', ':'))
+                        os.chmod(tmp, 0o644)
+                        os.rename(tmp, self.path)
+                        self.dirty = False
+                except (IOError, OSError):
+                        # the cache is optional e.g. in read-only directories
+                        pass
+
+class StationScans:
+        """
+        The scans of one station: the scan indices and recording durations
+        [s] as integer arrays.
+        """
+
+        def __init__(self):
+                self.scan_idx = array('l')
+                self.durations = array('l')
+
+        def __len__(self):
+                return len(self.scan_idx)
+
+        def append(self, scan_idx, duration):
+                self.scan_idx.append(scan_idx)
+                self.durations.append(duration)
+
+        def as_dict(self):
+                return dict(zip(self.scan_idx, self.durations))
+
+
+class VexFile:
+        """
+        The index and the schedule of a VEX file (see module description).
+
+        blocks  {block name: offset}
+        defs    {block name: {def name: offset}}
+        exper   {parameter: value} of the first def of the $EXPER block
+        scan_names, scan_starts, scan_offsets, scan_sources  one entry per scan
+        sources list of the source names referenced by scan_sources
+        stations {station code: StationScans}
+        diff    the scans added, removed and changed since the last use of
+                the cache (see ScanCache.update), None without cache or
+                on the first use of the cache
+        """
+
+        def __init__(self, path, cache=None):
+
+                self.path = path
+                self.blocks = {}
+                self.defs = {}
+                self.exper = {}
+                self.scan_names = []
+                self.scan_starts = []
+                self.scan_offsets = array('l')
+                self.scan_sources = array('l')
+                self.sources = []
+                self.stations = {}
+                self.diff = None
+                self.parsed_scans = None
+                self._source_idx = {}
+
+                with open(path, 'rb') as f:
+                        if cache is None:
+                                self._parse(tokenize(f))
+                        else:
+                                with _gc_paused():
+                                        self._parse_cached(f, cache)
+
+        def _parse_cached(self, f, cache):
+
+                try:
+                        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:
+                        # empty file
+                        return
+                sched = _sched_block.search(data)
+                if sched is None:
+                        self._parse(tokenize(f))
+                        return
+
+                self._parse(tokenize(io.BytesIO(data[:sched.end()])))
+
+                # only the scans whose text is not in the cache are parsed
+                names = []
+                parsed = 0
+                pos = sched.end()
+                for end in _scan_ends(data, pos):
+                        text = data[pos:end]
+                        digest = hashlib.sha1(text).hexdigest()
+                        scan = cache.get(digest)
+                        if scan is None:
+                                parsed += 1
+                                scan = parse_scan(tokenize(text.splitlines(True)))
+                                if scan is None:
+                                        pos = end
+                                        continue
+                                scan = (scan['name'], scan['offset'], scan['start'], scan['source'], tuple(scan['stations']))
+                                cache.put(digest, scan)
+                        name, offset, start, source, stations = scan
+                        self._add_scan(name, pos + offset, start, source, stations)
+                        names.append((name, digest))
+                        pos = end
+
+                # the remaining blocks follow the last scan
+                self._parse(tokenize(io.BytesIO(data[pos:]), pos))
+                data.close()
+                self.parsed_scans = parsed
+                self.diff = cache.update(names)
+
+        def _parse(self, statements):
+
+                block = None
+                current_def = None
+                scan = None
+
+                for offset, statement in statements:
+                        if statement[0] == '$':
+                                block = statement
+                                self.blocks[block] = offset
+                                self.defs.setdefault(block, {})
+                                current_def = None
+                                continue
+
+                        # most statements are the scan parameters: handle them first
+                        if scan is not None:
+                                if scan_parameter(scan, statement):
+                                        self._add_scan(scan['name'], scan['offset'], scan['start'], scan['source'], scan['stations'])
+                                        scan = None
+                                continue
+
+                        words = statement.split(None, 1)
+                        keyword = words[0]
+
+                        if keyword == 'def' and len(words) > 1:
+                                current_def = words[1]
+                                self.defs[block][current_def] = offset
+                        elif keyword == 'enddef':
+                                current_def = None
+                        elif keyword == 'scan' and len(words) > 1 and block == '$SCHED':
+                                scan = new_scan(words[1], offset)
+                        elif block == '$EXPER' and current_def is not None:
+                                if len(self.defs[block]) == 1:
+                                        key, value = split_assignment(statement)
+                                        if value is not None:
+                                                self.exper[key] = value
+
+        def _add_scan(self, name, offset, start, source, stations):
+
+                idx = len(self.scan_names)
+                self.scan_names.append(name)
+                self.scan_starts.append(start)
+                self.scan_offsets.append(offset)
+
+                if source not in self._source_idx:
+                        self._source_idx[source] = len(self.sources)
+                        self.sources.append(source)
+                self.scan_sources.append(self._source_idx[source])
+
+                for station, duration in stations:
+                        station_scans = self.stations.get(station)
+                        if station_scans is None:
+                                station_scans = self.stations[station] = StationScans()
+                        station_scans.scan_idx.append(idx)
+                        station_scans.durations.append(duration)
+
+        def __len__(self):
+                return len(self.scan_names)
+
+        def scan(self, idx):
+                """
+                Returns (name, start, source) of the scan with the given index.
+                """
+
+                return self.scan_names[idx], self.scan_starts[idx], self.sources[self.scan_sources[idx]]
+
+        def station_scans(self, station, equiv_map=None):
+                """
+                Returns the scans of a station as a list of (scan index,
+                duration) tuples in schedule order. Scans without the station
+                but with a station mapped to it by equiv_map (e.g. 'A1': 'Az')
+                are included with the duration of the equivalent station.
+                """
+
+                equiv_map = equiv_map or {}
+                durations = {}
+                # in the order of appearance in the VEX file
+                for code, station_scans in self.stations.items():
+                        if code != station and equiv_map.get(code) == station:
+                                durations.update(station_scans.as_dict())
+                if station in self.stations:
+                        durations.update(self.stations[station].as_dict())
+
+                return sorted(durations.items())
+
+        def statements(self, block, name=None):
+                """
+                Reads the statements of a block or, if name is given, of a
+                def or scan of the block again from the file. Yields (offset,
+                statement) tuples.
+                """
+
+                if name is None:
+                        offset = self.blocks[block]
+                        end = ('$',)
+                elif block == '$SCHED':
+                        offset = self.scan_offsets[self.scan_names.index(name)]
+                        end = ('endscan',)
+                else:
+                        offset = self.defs[block][name]
+                        end = ('enddef',)
+
+                with open(self.path, 'rb') as f:
+                        f.seek(offset)
+                        first = True
+                        for pos, statement in tokenize(f, offset):
+                                if not first and statement.startswith(end):
+                                        if end != ('$',):
+                                                yield pos, statement
+                                        return
+                                first = False
+                                yield pos, statement
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+###########################################################################
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+'''
+Benchmark of the assembly of the DDC spectrum in getM5specTone.
+
+The preallocated assembly (assembleDDC) is compared with the np.append /
+np.delete loop it replaced, for 16, 32 and 64 bands.
+'''
+
+import timeit
+import argparse
+import numpy as np
+
+from getM5specTone import assembleDDC
+
+
+def appendAssembleDDC(data):
+    '''
+    The assembly loop of processDDC before it was preallocated.
+    '''
+
+    numBands = int((data.shape[1]-1) / 2)
+    y = np.empty([0])
+    for band in range(0,numBands,2):
+
+        lsb = np.flipud(data[:, band+2])
+        usb = data[:, band+1]
+
+        temp = np.empty([1])
+        temp = np.append(temp, lsb)
+        temp = np.delete(temp,len(temp)-1)
+        # concenate the columns data
+        # lower sideband first flipped
+        y = np.append(y, temp)
+        # then upper sideband
+        y = np.append(y, usb)
+
+    return y
+
+def preallocatedAssembleDDC(data):
+
+    numBands = int((data.shape[1]-1) / 2)
+    lsbs = np.flipud(data[:, 2:numBands+1:2])
+    usbs = data[:, 1:numBands+1:2]
+
+    return assembleDDC(lsbs, usbs)
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Measures the assembly time of the DDC spectrum.")
+    parser.add_argument("-p", "--points", type=int, default=32768, help="The number of spectral points per band (default: %(default)s).")
+    parser.add_argument("-r", "--repeat", type=int, default=20, help="The number of runs; the fastest is reported (default: %(default)s).")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+
+    print ("%6s %14s %18s %8s" % ("bands", "append [ms]", "preallocated [ms]", "speedup"))
+    for numBands in (16, 32, 64):
+        # m5spec layout: frequency column, numBands auto spectra, cross spectra
+        data = rng.normal(10, 1, (args.points, 2 * numBands + 1))
+
+        old = appendAssembleDDC(data)
+        new = preallocatedAssembleDDC(data)
+        # the first LSB channel of each BBC was uninitialised memory before
+        valid = np.ones(len(new), dtype=bool)
+        valid[::2 * args.points] = False
+        if not np.array_equal(old[valid], new[valid]):
+            raise SystemExit("The assembled spectra differ for %d bands" % numBands)
+
+        tOld = min(timeit.repeat(lambda: appendAssembleDDC(data), number=1, repeat=args.repeat))
+        tNew = min(timeit.repeat(lambda: preallocatedAssembleDDC(data), number=1, repeat=args.repeat))
+        print ("%6d %14.2f %18.2f %7.1fx" % (numBands, tOld * 1000, tNew * 1000, tOld / tNew))
+
+
+if __name__ == "__main__":
+    main()
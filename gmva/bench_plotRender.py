@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+###########################################################################
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+'''
+Benchmark of the png rendering time of a spectrum against its size.
+
+One trace is plotted and saved with the Agg backend, once with all points
+and once decimated to the axes width (see decimate.minMaxDecimate), as
+done by plot_pfb_m5spec.py, getM5specTone.py and the dashboard.
+'''
+
+import io
+import time
+import argparse
+import numpy as np
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+from decimate import minMaxDecimate, pixelWidth
+
+
+def render(x, y, decimate):
+    '''
+    Plots and saves one trace. Returns the time [s] and the number of points
+    drawn.
+    '''
+
+    start = time.perf_counter()
+    fig = plt.figure(figsize=(10, 6), dpi=100)
+    ax = fig.gca()
+    if decimate:
+        x, y = minMaxDecimate(x, y, pixelWidth(ax))
+    ax.plot(x, y)
+    fig.savefig(io.BytesIO(), format="png")
+    plt.close(fig)
+
+    return (time.perf_counter() - start, len(y))
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Measures the png rendering time of a spectrum with and without decimation.")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="The number of runs; the fastest is reported (default: %(default)s).")
+    parser.add_argument("sizes", type=int, nargs="*", default=[16384, 262144, 2097152], help="The number of spectral points (default: 16384 262144 2097152).")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+
+    # warm up the font cache etc.
+    render(np.arange(10.0), np.arange(10.0), False)
+
+    print ("%10s %12s %16s %10s" % ("points", "full [s]", "decimated [s]", "drawn"))
+    for size in args.sizes:
+        x = np.linspace(0, 512, size, endpoint=False)
+        y = rng.normal(10, 1, size)
+        y[::size // 16] += 30
+
+        full = min([render(x, y, False)[0] for i in range(args.repeat)])
+        decimated = [render(x, y, True) for i in range(args.repeat)]
+        print ("%10d %12.3f %16.3f %10d" % (size, full, min([t for t, n in decimated]), decimated[0][1]))
+
+
+if __name__ == "__main__":
+    main()
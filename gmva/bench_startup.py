@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+###########################################################################
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+'''
+Benchmark of the import and startup time of the QA scripts.
+
+Every measurement runs in a fresh interpreter. The time of importing
+matplotlib.pyplot is shown for comparison: it was paid by every run before
+the scripts imported matplotlib only for plotting.
+'''
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+# registered in the fresh interpreter: reports on exit whether matplotlib was loaded
+checkMatplotlib = "import atexit, sys; atexit.register(lambda: print('matplotlib' in sys.modules, file=sys.stderr)); "
+
+
+def runTimed(args, repeat):
+    '''
+    Runs the command repeat times. Returns the fastest wall time [s] and
+    whether matplotlib was loaded (as reported on stderr).
+    '''
+
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        ret = subprocess.run(args, cwd=here, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return (best, ret.stderr.decode().strip().endswith("True"))
+
+def writeM5spec(path, points=1024, bands=16):
+
+    x = np.arange(points) * 16.0 / points
+    data = np.column_stack([x] + [np.random.default_rng(band).normal(10, 1, points) for band in range(2 * bands)])
+    np.savetxt(path, data, fmt="%.6f")
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Measures the import and startup time of the QA scripts.")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="The number of runs of each command; the fastest is reported (default: %(default)s).")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+        m5spec = os.path.join(tmpDir, "bench.m5spec")
+        writeM5spec(m5spec)
+
+        jsonRun = "sys.argv = ['getM5specTone.py', '-j', %r]; import runpy; runpy.run_path('getM5specTone.py', run_name='__main__')" % m5spec
+
+        commands = [
+            ("python startup", "pass"),
+            ("import matplotlib.pyplot", "import matplotlib.pyplot"),
+            ("import m5data", "import m5data"),
+            ("import getM5specTone", "import getM5specTone"),
+            ("import plot_pfb_m5spec", "import plot_pfb_m5spec"),
+            ("import plot_m5bstate", "import plot_m5bstate"),
+            ("getM5specTone.py -j (16 bands)", jsonRun),
+        ]
+
+        print ("%-32s %10s %12s" % ("command", "time [ms]", "matplotlib"))
+        for name, code in commands:
+            elapsed, loaded = runTimed([sys.executable, "-c", checkMatplotlib + code], args.repeat)
+            print ("%-32s %10.1f %12s" % (name, elapsed * 1000, "loaded" if loaded else "-"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+###########################################################################
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+'''
+Benchmark of the 2-bit unpacking of vdif.
+
+The lookup table decoders are compared with a per-sample reference decoder
+written directly from the VDIF bit layout. The results of all decoders are
+checked against the reference for 1 to 16 channels before timing.
+'''
+
+import timeit
+import argparse
+import numpy as np
+
+import vdif
+
+
+def referenceDecode2bit(payload, nchan):
+    '''
+    Decodes 2-bit samples one at a time. Returns a float32 array of shape
+    (nchan, samples).
+    '''
+
+    payload = bytes(np.asarray(payload, dtype=np.uint8).ravel())
+    numSamples = len(payload) * 4 // nchan
+    out = np.empty((nchan, numSamples), dtype=np.float32)
+
+    for i in range(len(payload) * 4):
+        # 4 samples per byte, the first sample in the least significant bits
+        code = (payload[i // 4] >> (2 * (i % 4))) & 3
+        out[i % nchan, i // nchan] = vdif.levels2bit[code]
+
+    return out
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Measures the decoding speed of 2-bit VDIF samples.")
+    parser.add_argument("-b", "--bytes", type=int, default=500000, help="The payload size [bytes] (default: %(default)s).")
+    parser.add_argument("-c", "--channels", type=int, default=16, help="The number of interleaved channels (default: %(default)s).")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="The number of runs; the fastest is reported (default: %(default)s).")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    payload = rng.integers(0, 256, args.bytes, dtype=np.uint8)
+    numSamples = args.bytes * 4
+
+    # the reference is slow: verify on a smaller payload
+    check = payload[:16000]
+    for nchan in (1, 2, 4, 8, 16):
+        reference = referenceDecode2bit(check, nchan)
+        if not np.array_equal(vdif.decode2bit(check, nchan), reference):
+            raise SystemExit("decode2bit differs from the reference for %d channels" % nchan)
+        if not np.array_equal(vdif.levels2bit[vdif.decode2bit(check, nchan, np.uint8)], reference):
+            raise SystemExit("The state codes differ from the reference for %d channels" % nchan)
+
+    decoders = [
+        ("reference (per sample)", lambda: referenceDecode2bit(payload, args.channels), 1),
+        ("decode2bit float32", lambda: vdif.decode2bit(payload, args.channels), args.repeat),
+        ("decode2bit int8", lambda: vdif.decode2bit(payload, args.channels, np.int8), args.repeat),
+        ("unpack2bit state codes", lambda: vdif.unpack2bit(payload, args.channels), args.repeat),
+    ]
+
+    print ("%d bytes, %d channels" % (args.bytes, args.channels))
+    print ("%-24s %10s %16s" % ("decoder", "time [ms]", "Msamples/s"))
+    for name, decode, repeat in decoders:
+        elapsed = min(timeit.repeat(decode, number=1, repeat=repeat))
+        print ("%-24s %10.2f %16.1f" % (name, elapsed * 1000, numSamples / elapsed / 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -24,7 +24,13 @@ import shutil
 import subprocess
 from datetime import datetime
 import shlex
+import tempfile
 import json
+from concurrent.futures import ThreadPoolExecutor
+
+from sshSession import SshSession
+from m5data import readM5spec, parseM5spec
+import getM5specTone
 
 progs = ["mk6record.py", "mountRecorder.sh", "unmountRecorder.sh", "getM5specTone.py"]
 
@@ -53,42 +59,66 @@ def checkPrerequisits():
     if error > 0:
         sys.exit("Exiting")
 
-def plotM5spec(lowFreq):
-
-    arg = ""
-    if args.showPlot:
-        arg = "-X"
-    elif args.json:
-        arg = "-j"
+def extractTones(pol, lowFreq, spectrum=None, data=None):
+    '''
+    Extracts the tones from the m5spec file of the given polarisation.
+    If data is given (the parsed m5spec output) it is used instead of the
+    file. spectrum (the raw m5spec output) is passed to the plot.
+    In json mode the list of tones is returned. With -X getM5specTone.py
+    is launched in the background to display the spectrum.
+    '''
 
-    title1 = "Polarization_1_%s" % args.recorder
-    title2 = "Polarization_2_%s" % args.recorder
-    #workDir = "/home/oper/tonecheck/test"
-    pol1Cmd = "getM5specTone.py %s -l %d -t %s %s/pol1.m5spec " % (arg, lowFreq, title1, workDir)
-    pol2Cmd = "getM5specTone.py %s -l %d -t %s %s/pol2.m5spec " % (arg, lowFreq, title2, workDir)
+    infile = "%s/pol%d.m5spec" % (workDir, pol)
 
     if args.showPlot:
-        os.system(pol1Cmd + "&")
-        os.system(pol2Cmd + "&")
-    else:
-        p = subprocess.Popen(shlex.split(pol1Cmd),  stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        result = p.stdout.readlines()
-        # the serialized string must be deserialized into a list
-    
-        if (args.json):
-            tones = json.loads(result[0].decode('utf-8'))
-            print (tones)
+        title = "Polarization_%d_%s" % (pol, args.recorder)
+        if spectrum is None:
+            os.system("getM5specTone.py -X -l %d -t %s %s &" % (lowFreq, title, infile))
         else:
-            print (result)
+            p = subprocess.Popen(shlex.split("getM5specTone.py -X -l %d -t %s -" % (lowFreq, title)), stdin=subprocess.PIPE)
+            p.stdin.write(spectrum)
+            p.stdin.close()
+        return None
 
-        p = subprocess.Popen(shlex.split(pol2Cmd),  stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        result = p.stdout.readlines()
-        # the serialized string must be deserialized into a list
-        if (args.json):
-            tones = json.loads(result[0].decode('utf-8'))
-            print (tones)
+    if data is None:
+        data = readM5spec(infile)
+
+    return getM5specTone.getTones(data, lowFreq)
+
+def processPolarisation(pol, slot):
+    '''
+    Runs the processing chain (fuse mount, remote m5spec, copy, tone extraction)
+    for one polarisation.
+    Returns a tuple (state, tones)
+    '''
+
+    if not fuseMount(args.recorder, slot):
+        return (False, None)
+
+    outfile = "%s/pol%d.m5spec" % (workDir, pol)
+
+    if args.stream:
+        # the raw output is only kept if it is archived or plotted
+        lines = [] if args.archive or args.showPlot else None
+        data = streamRemoteM5spec(session, slot, args.code, scan, lines)
+        if data is None:
+            print("Error in obtaining the m5spec output for polarisation %d" % pol)
+            return (False, None)
+        spectrum = b"".join(lines) if lines is not None else None
+        if args.archive:
+            with open(outfile, "wb") as f:
+                f.write(spectrum)
+        return (True, extractTones(pol, args.lowChan, spectrum, data))
+
+    file = runRemoteM5spec(session, slot, args.code, scan)
+    copyM5spec(session, file, "pol%d.m5spec" % pol)
+
+    if not os.path.exists(outfile):
+        print("Error in obtaining the m5spec file for polarisation %d" % pol)
+        return (False, None)
+
+    return (True, extractTones(pol, args.lowChan))
 
-    
 def recordScan(recorder, scanname, code):
 
     ret = subprocess.run(['mk6record.py', '-d 5', '-c %s'%(code), '-s %s'%(scanname), '-e tone', recorder])
@@ -115,21 +145,56 @@ def fuseMount(recorder, slot):
             return(False)
     return(True)
 
-def runRemoteM5spec(recorder, slot, code, scanname):
+def runRemoteM5spec(session, slot, code, scanname):
 
     # To do: check if remote mount directory exists
     # To do: handle abolute path on the remote side (remote which ?)
     command = "/home/oper/shared/difx/latest/bin/m5spec /mnt/diskpack/%s/tone_%s_%s.vdif %s 1024 2048 /tmp/%s_%s.m5spec" % (slot, code, scanname, dataFormat, scanname, slot)
 
-    ssh = subprocess.Popen(["ssh", recorder, command], shell=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    result = ssh.stdout.readlines()
+    session.run(command)
 
     return("/tmp/%s_%s.m5spec"%(scanname, slot))
 
-def copyM5spec(recorder, inname, outname):
+def streamRemoteM5spec(session, slot, code, scanname, lines=None):
+    '''
+    Runs m5spec on the recorder and parses its output while it is read from
+    the ssh pipe. No file is written on the recorder. If lines is a list the
+    raw output lines are appended to it.
+    Returns the m5spec data or None if m5spec failed.
+    '''
+
+    # m5spec writes the spectrum to the original stdout (fd 3), its messages are sent to stderr
+    command = "/home/oper/shared/difx/latest/bin/m5spec /mnt/diskpack/%s/tone_%s_%s.vdif %s 1024 2048 /dev/fd/3 3>&1 1>&2" % (slot, code, scanname, dataFormat)
 
-    ret = subprocess.run(['scp', 'oper@%s:%s'%(recorder, inname), "%s/%s" % (workDir, outname)])
-    return(True)
+    # the messages go to a file: an unread stderr pipe could block m5spec
+    with tempfile.TemporaryFile() as messages:
+        proc = session.popen(command, stdout=subprocess.PIPE, stderr=messages)
+        try:
+            data = parseM5spec(_readLines(proc.stdout, lines))
+        except ValueError:
+            data = None
+        finally:
+            proc.stdout.close()
+        ret = proc.wait()
+
+        # partial output of a failed m5spec is not used
+        if ret != 0 or data is None or data.size == 0:
+            messages.seek(0)
+            print("m5spec failed on %s (exit code %d): %s" % (args.recorder, ret, messages.read().decode('utf-8', 'replace').strip()))
+            return(None)
+
+    return(data)
+
+def _readLines(stream, lines):
+
+    for line in stream:
+        if lines is not None:
+            lines.append(line)
+        yield line.decode('utf-8')
+
+def copyM5spec(session, inname, outname):
+
+    return(session.copyFrom(inname, "%s/%s" % (workDir, outname)))
 
 
 def startModeOCT(args):
@@ -180,6 +245,9 @@ common.add_argument("-l", "--low-freq", type=int, dest="lowChan", default=0, hel
 group = common.add_mutually_exclusive_group(required=True)
 group.add_argument("-j","--json",  action='store_true', help="Print the tone information in serialized json format")
 group.add_argument("-X", dest='showPlot', action='store_true', help="Show a graphical display of the spectrum and the detected tones.")
+common.add_argument("-S", "--stream", action='store_true', help="Read the spectra directly from the ssh connection instead of writing them to a file on the recorder and copying them.")
+common.add_argument("--archive", action='store_true', help="In stream mode keep a copy of the spectra in the working directory.")
+common.add_argument("-P", "--parallel", action='store_true', help="Process both polarizations concurrently.")
 common.add_argument("recorder", type=str, help="The hostname or IP of the mark6 recorder.")
 
 subparsers = parser.add_subparsers (help="subcomand help")
@@ -237,34 +305,38 @@ state = recordScan(args.recorder, scan, args.code)
 if not state:
     sys.exit("An error has occured during recording. Exiting")
 
-# fuse mount the remote modules for pol1 and pol2
-print ("=== Fuse mounting the modules")
-state = fuseMount(args.recorder, args.pol1Slot)
-if not state:
-    print("An error has occured during fuse mounting of slot %s in %s" % (args.pol1Slot, args.recorder))
-    print("The recording was expected to be done in slot(s)=%s (for pol 1) and slot(s)=%s (for pol 2)" % (args.pol1Slot, args.pol2Slot))
-    print("Different setups can be specified with the -p1 and -p2 options. See help for details.")
-    sys.exit(1)
-
-state = fuseMount(args.recorder, args.pol2Slot)
-if not state:
-    sys.exit("An error has occured during fuse mounting of slot %s in %s. Exiting" % (args.pol2Slot, args.recorder))
-
-# run m5spec on the recorder
-print ("=== Running m5spec")
-file = runRemoteM5spec(args.recorder, args.pol1Slot, args.code, scan)
-copyM5spec(args.recorder, file, "pol1.m5spec")
-
-file = runRemoteM5spec(args.recorder, args.pol2Slot, args.code, scan)
-copyM5spec(args.recorder, file, "pol2.m5spec")
-
-if not os.path.exists(workDir + "/pol1.m5spec") or not os.path.exists(workDir + "/pol2.m5spec"):
-    sys.exit("Error in obtaining the m5spec file. Exiting")
-
-
-# plotting the spectra
-print ("=== Extracting the tones")
-plotM5spec(args.lowChan)
+# open a persistent connection to the recorder used for all remote commands
+session = SshSession(args.recorder, user="oper")
+session.open()
+
+# process both polarisations (fuse mount, m5spec, tone extraction)
+print ("=== Processing the modules")
+slots = {1: args.pol1Slot, 2: args.pol2Slot}
+if args.parallel:
+    with ThreadPoolExecutor(max_workers=len(slots)) as pool:
+        futures = {pol: pool.submit(processPolarisation, pol, slot) for pol, slot in slots.items()}
+        results = {pol: future.result() for pol, future in futures.items()}
+else:
+    results = {}
+    for pol, slot in slots.items():
+        results[pol] = processPolarisation(pol, slot)
+        if not results[pol][0]:
+            break
+
+for pol in results:
+    state, tones = results[pol]
+    if not state:
+        print("An error has occured during processing of slot %s in %s" % (slots[pol], args.recorder))
+        print("The recording was expected to be done in slot(s)=%s (for pol 1) and slot(s)=%s (for pol 2)" % (args.pol1Slot, args.pol2Slot))
+        print("Different setups can be specified with the -p1 and -p2 options. See help for details.")
+        session.close()
+        sys.exit(1)
+
+if args.json:
+    # combined report for both polarisations
+    print (json.dumps({"pol%d" % pol: results[pol][1] for pol in slots}))
 
 print ("=== Fuse umounting the modules")
 state = fuseUnmount(args.recorder, args.pol1Slot)
+
+session.close()
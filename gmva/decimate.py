@@ -0,0 +1,67 @@
+###########################################################################
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+'''
+Reduction of long traces to about the number of pixels available for
+plotting them.
+
+The trace is split into one bin per pixel and only the minimum and the
+maximum of each bin are kept (in their original order). A line drawn
+through these points covers the same pixels as the full trace, so narrow
+peaks such as phase-cal tones stay visible.
+'''
+
+import numpy as np
+
+
+def minMaxDecimate(x, y, numBins):
+    '''
+    Returns the decimated x and y arrays with at most 2*numBins points.
+    Traces that are short enough are returned unchanged. NaN values are
+    ignored, bins containing only NaNs are kept as NaN so gaps in the trace
+    remain visible.
+    '''
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    numBins = max(1, int(numBins))
+    n = len(y)
+
+    if n <= 2 * numBins:
+        return x, y
+
+    binSize = -(-n // numBins)
+    numBins = -(-n // binSize)
+    padded = np.full(numBins * binSize, np.nan)
+    padded[:n] = y
+    bins = padded.reshape(numBins, binSize)
+
+    nan = np.isnan(bins)
+    lo = np.argmin(np.where(nan, np.inf, bins), axis=1)
+    hi = np.argmax(np.where(nan, -np.inf, bins), axis=1)
+
+    # keep the extremes of each bin in their original order
+    offset = np.arange(numBins) * binSize
+    idx = np.sort(np.stack((lo, hi), axis=1), axis=1) + offset[:, np.newaxis]
+    idx = np.minimum(idx.ravel(), n - 1)
+
+    return x[idx], y[idx]
+
+def pixelWidth(ax):
+    '''
+    Returns the width of a matplotlib axes in pixels.
+    '''
+
+    return int(np.ceil(ax.get_window_extent().width))
@@ -20,70 +20,144 @@
 import sys
 import math
 import numpy as np
-import matplotlib.pyplot as plt
 import argparse
 import json
 
+from toneDetect import findPeaks, refinePeaks, baselineModes, fitModes
+from m5data import readM5spec, parseM5spec
+from decimate import minMaxDecimate, pixelWidth
 
-def processSingleBand():
+
+def getTones(data, lowChan=0, baseline="global", window=64, fit="gaussian", log=None):
+    '''
+    Returns the list of tones found in the contents of an m5spec file
+    (see analyseSpectrum).
+    '''
+
+    return analyseSpectrum(data, lowChan, baseline, window, fit, log)[2]
+
+def analyseSpectrum(data, lowChan=0, baseline="global", window=64, fit="gaussian", log=None):
+    '''
+    Extracts the tones from the contents of an m5spec file given as a 2-D
+    array (see m5data.readM5spec).
+
+    Each tone is a dict with the keys freq and amp (frequency and amplitude of
+    the peak channel) and fitFreq and fitAmp (interpolated between channels).
+    log is an optional function called with progress messages.
+
+    Returns a tuple (x, y, tones, xticks) with the frequency axis and the
+    concatenated spectrum of all bands, the tones and the band edges.
+    '''
+
+    if log is None:
+        log = _quiet
+
+    if data.shape[1] == 2:
+        # in case of a single subband the m5spec file will not contain any additional cross-spectrum columns
+        numBands = 1
+    else:
+        numBands = int((data.shape[1]-1) / 2)
+
+    freqRes = data[1][0] - data[0][0]
+    bandwidth = data.shape[0] * freqRes
+
+    pointsPerBand = len (data[:,0])
+    log("Found %s bands with a band width of %d [MHz]"% (numBands, bandwidth))
+    log("The frequency resolution is %f [MHz]" % freqRes);
+
+    xticks = range(int(lowChan), int(lowChan) + numBands*int(bandwidth)+1, int(bandwidth))
+
+    x = np.linspace(lowChan, lowChan + numBands*bandwidth, num=numBands*pointsPerBand, endpoint=False)
+
+    if numBands == 1:
+        y, tones = processSingleBand(data, x, freqRes, baseline, window, fit, log)
+    else:
+        # if more than one subband we assume the data has been observed in the DBBC3 DDC mode
+        # with alternating USB and LSB subbands
+        y, tones = processDDC(data, x, freqRes, baseline, window, fit, log)
+
+    return (x, y, tones, xticks)
+
+def processSingleBand(data, x, freqRes, baseline, window, fit, log):
 
     tones = []
     y = data[:,1]
 
-    peaks =  findPeaks(y)
-    for peak in peaks:
+    peaks = findPeaks(y, baseline=baseline, window=window)
+    offsets, amps = refinePeaks(y, peaks, fit)[0]
+    for peak, offset, amp in zip(peaks[0], offsets, amps):
         peakFreq = x[peak]
         #peakY.append(y[peak])
         #peakIdx.append(peakFreq)
 
-        verbose("Found peak at Freq=%f Amplitude=%f (Idx=%d)" % (peakFreq, y[peak], peak))
-        tones.append({'freq': peakFreq, 'amp': y[peak]})
+        log("Found peak at Freq=%f Amplitude=%f (Idx=%d) fitted: Freq=%f Amplitude=%f" % (peakFreq, y[peak], peak, peakFreq + offset*freqRes, amp))
+        tones.append({'freq': peakFreq, 'amp': y[peak], 'fitFreq': peakFreq + offset*freqRes, 'fitAmp': amp})
 
     return (y, tones)
     
-def processDDC():
+def processDDC(data, x, freqRes, baseline, window, fit, log):
 
     tones = []
-    y = np.empty([0])
+    numBands = int((data.shape[1]-1) / 2)
+    pointsPerBand = data.shape[0]
+
+    # for DDC modes the vdif channel order is BBC1-USB,BBC1-LSB,BBC2-USB,BBC2-LSB,...
+    lsbs = np.flipud(data[:, 2:numBands+1:2])
+    usbs = data[:, 1:numBands+1:2]
+    lsbPeaks = findPeaks(lsbs, baseline=baseline, window=window)
+    usbPeaks = findPeaks(usbs, baseline=baseline, window=window)
+    lsbFits = refinePeaks(lsbs, lsbPeaks, fit)
+    usbFits = refinePeaks(usbs, usbPeaks, fit)
+
     for band in range(0,numBands,2):
 
-        # for DDC modes the vdif channel order is BBC1-USB,BBC1-LSB,BBC2-USB,BBC2-LSB,...
-        peaks = []
-        lsb = np.flipud(data[:, band+2])
-        usb = data[:, band+1]
+        lsb = lsbs[:, band//2]
+        usb = usbs[:, band//2]
 
-        peaks =  findPeaks(lsb)
-        for peak in peaks:
+        for peak, offset, amp in zip(lsbPeaks[band//2], *lsbFits[band//2]):
             peakFreq = x[band*pointsPerBand+peak+1]
-            tones.append({'freq': peakFreq, 'amp': lsb[peak]})
-            verbose("Found tone (LSB) at Freq=%f Amplitude=%f (Idx=%d)" % (peakFreq, lsb[peak], peak))
+            tones.append({'freq': peakFreq, 'amp': lsb[peak], 'fitFreq': peakFreq + offset*freqRes, 'fitAmp': amp})
+            log("Found tone (LSB) at Freq=%f Amplitude=%f (Idx=%d) fitted: Freq=%f Amplitude=%f" % (peakFreq, lsb[peak], peak, peakFreq + offset*freqRes, amp))
         
-
-        peaks =  findPeaks(usb)
-        for peak in peaks:
+        for peak, offset, amp in zip(usbPeaks[band//2], *usbFits[band//2]):
             peakFreq = x[(band+1)*pointsPerBand+peak]
-            tones.append({'freq': peakFreq, 'amp': usb[peak]})
-            verbose("Found tone (USB) at Freq=%f Amplitude=%f (Idx=%d)" % (peakFreq, lsb[peak], peak))
-
-        # how to properly deal with the LSB / USB inversion ?
-        # does the DC frequency  correspond to channel 0 in USB or the last channel of LSB?
-        # for now go with USB(0).
-        # This means that the frequency in LSB must be shifted by one channel
-        temp = np.empty([1])
-        temp = np.append(temp, lsb)
-        temp = np.delete(temp,len(temp)-1)
-        # concenate the columns data
-        # lower sideband first flipped 
-        y = np.append(y, temp)
-        # then upper sideband
-        y = np.append(y, usb)
+            tones.append({'freq': peakFreq, 'amp': usb[peak], 'fitFreq': peakFreq + offset*freqRes, 'fitAmp': amp})
+            log("Found tone (USB) at Freq=%f Amplitude=%f (Idx=%d) fitted: Freq=%f Amplitude=%f" % (peakFreq, usb[peak], peak, peakFreq + offset*freqRes, amp))
 
     if len(tones) == 0:
-        verbose("No tones found")
-
-    return (y, tones)
-
-def plotSpectrum(x,y,tones, xticks):
+        log("No tones found")
+
+    return (assembleDDC(lsbs, usbs), tones)
+
+def assembleDDC(lsbs, usbs):
+    '''
+    Concatenates the sidebands of all BBCs (columns of lsbs and usbs, the
+    LSBs already flipped) into one spectrum: for each BBC the lower sideband
+    first then the upper sideband.
+    '''
+
+    # how to properly deal with the LSB / USB inversion ?
+    # does the DC frequency  correspond to channel 0 in USB or the last channel of LSB?
+    # for now go with USB(0).
+    # This means that the frequency in LSB must be shifted by one channel.
+    # The lowest LSB channel has no data after the shift.
+    numBBCs = usbs.shape[1]
+    pointsPerBand = usbs.shape[0]
+    spectrum = np.empty((numBBCs, 2, pointsPerBand))
+    spectrum[:, 0, 0] = np.nan
+    spectrum[:, 0, 1:] = lsbs[:-1].T
+    spectrum[:, 1, :] = usbs.T
+
+    return spectrum.reshape(-1)
+
+def plotSpectrum(x,y,tones, xticks, title="spectrum", showPlot=False, pngPath=None):
+
+    # matplotlib is only imported when plotting, it is not needed for the tone extraction
+    import matplotlib
+    if not showPlot:
+        # only saving to png: no need for an interactive backend
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
 
     data = []
 
@@ -103,7 +177,9 @@ def plotSpectrum(x,y,tones, xticks):
 
 
     plt.figure(figsize=(10, 6))
-    plt.plot(x, y)
+    # draw the min/max envelope at about the axes resolution instead of every point
+    xPlot, yPlot = minMaxDecimate(x, y, pixelWidth(plt.gca()))
+    plt.plot(xPlot, yPlot)
 
     if len(tones) > 0:
             plt.plot(peakX, peakY, "o", color='r', label="Peaks")
@@ -113,7 +189,7 @@ def plotSpectrum(x,y,tones, xticks):
     #plt.legend()
     plt.xticks(xticks)
     plt.grid(True)
-    plt.title(args.title)
+    plt.title(title)
 
     if len(data) > 0:
         table = plt.table(cellText=data,
@@ -124,84 +200,53 @@ def plotSpectrum(x,y,tones, xticks):
         table.auto_set_column_width(1)
         table.auto_set_font_size(True)
 
-    if args.showPlot:
+    if showPlot:
         plt.show()
-    if args.pngPath:
+    if pngPath:
         try:
-            plt.savefig(args.pngPath)
+            plt.savefig(pngPath)
         except Exception as e:
-            print("Error saving figure to: %s (%s)" % (args.pngPath, e))
-
-def findPeaks(y):
+            print("Error saving figure to: %s (%s)" % (pngPath, e))
 
-    z_threshold = 4.5         # Threshold for Z-Score
-    minDist= 1            # Mindestabstand zwischen Peaks in Punkten
-    peaks = []
+def _quiet(message):
+    pass
 
-    # calculate the z-scores
-    mean_y = np.mean(y)
-    std_y = np.std(y)
-    z_scores = (y - mean_y) / std_y
+def main():
 
-    lastPeakPos = -minDist - 1
-    
-    for i in range(1, len(y)-1):
-        if z_scores[i] >= z_threshold:                  # Z-score above threshold?
-            if y[i] > y[i-1] and y[i] > y[i+1]:          # local minimum
-                if i - lastPeakPos > minDist:
-                    peaks.append(i)
-                    lastPeakPos = i
-
-    return(peaks)
-
-def verbose(message):
-    if not args.json:
-        print (message)
-        
-
-
-parser = argparse.ArgumentParser( description='Program to plot the results from m5spec')
+    parser = argparse.ArgumentParser( description='Program to plot the results from m5spec')
 
-parser.add_argument("-t", "--title", default="spectrum", help="The title to use for the plot. Only relevant together with the -X or --png options.")
-parser.add_argument("-l", "--low-freq", type=int, dest="lowChan", default=0, help="The frequency of the lowest baseband channel [MHz]")
-group = parser.add_mutually_exclusive_group()
-group.add_argument("-X", dest='showPlot', action='store_true', help="Show a graphical display of the spectrum and the detected peaks.")
-group.add_argument("-j","--json",  action='store_true', help="Print the tone information in serialized json format")
-parser.add_argument("--png", type=str, dest="pngPath", help="The filename of the png file to be saved to hard disk.")
-parser.add_argument("m5spec", type=str, help="The filename of the .m5spec file")
+    parser.add_argument("-t", "--title", default="spectrum", help="The title to use for the plot. Only relevant together with the -X or --png options.")
+    parser.add_argument("-l", "--low-freq", type=int, dest="lowChan", default=0, help="The frequency of the lowest baseband channel [MHz]")
+    parser.add_argument("-b", "--baseline", choices=baselineModes, default="global", help="The baseline used for the tone detection. global: mean and rms of the whole band; median: running median and MAD (robust against bandpass slopes and RFI) (default: %(default)s).")
+    parser.add_argument("-f", "--fit", choices=fitModes, default="gaussian", help="The method used to interpolate the tone frequency and amplitude between the spectral points (default: %(default)s).")
+    parser.add_argument("-w", "--window", type=int, default=64, help="The number of spectral points of the running window used with --baseline median (default: %(default)s).")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("-X", dest='showPlot', action='store_true', help="Show a graphical display of the spectrum and the detected peaks.")
+    group.add_argument("-j","--json",  action='store_true', help="Print the tone information in serialized json format")
+    parser.add_argument("--png", type=str, dest="pngPath", help="The filename of the png file to be saved to hard disk.")
+    parser.add_argument("m5spec", type=str, help="The filename of the .m5spec file. Use - to read from stdin.")
 
-args = parser.parse_args()
-
-# load the m5spec file
-data = np.loadtxt(args.m5spec, delimiter=None)
-verbose("Loaded m5spec file: %s" % args.m5spec)
-
-if data.shape[1] == 2:
-    # in case of a single subband the m5spec file will not contain any additional cross-spectrum columns
-    numBands = 1
-else:
-    numBands = int((data.shape[1]-1) / 2)
+    args = parser.parse_args()
 
-freqRes = data[1][0] - data[0][0]
-bandwidth = data.shape[0] * freqRes
+    def verbose(message):
+        if not args.json:
+            print (message)
 
-pointsPerBand = len (data[:,0])
-verbose("Found %s bands with a band width of %d [MHz]"% (numBands, bandwidth))
-verbose("The frequency resolution is %f [MHz]" % freqRes);
+    # load the m5spec file
+    if args.m5spec == "-":
+        data = parseM5spec(sys.stdin)
+    else:
+        data = readM5spec(args.m5spec)
+    verbose("Loaded m5spec file: %s" % args.m5spec)
 
-xticks = range(int(args.lowChan), int(args.lowChan) + numBands*int(bandwidth)+1, int(bandwidth))
+    x, y, tones, xticks = analyseSpectrum(data, args.lowChan, args.baseline, args.window, args.fit, verbose)
 
-x = np.linspace(args.lowChan, args.lowChan + numBands*bandwidth, num=numBands*pointsPerBand, endpoint=False)
+    if (args.showPlot or args.pngPath):
+        plotSpectrum(x,y, tones, xticks, args.title, args.showPlot, args.pngPath)
 
-if numBands == 1:
-    y, tones = processSingleBand()
-else:
-    # if more than one subband we assume the data has been observed in the DBBC3 DDC mode
-    # with alternating USB and LSB subbands
-    y, tones = processDDC()
+    if (args.json):
+        print(json.dumps(tones))
 
-if (args.showPlot or args.pngPath):
-    plotSpectrum(x,y, tones, xticks)
 
-if (args.json):
-    print(json.dumps(tones))
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+###########################################################################
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+
+import sys
+import json
+import socket
+import argparse
+import threading
+import queue
+
+from m5data import readM5spec, readM5bstate, bstateColor
+from decimate import minMaxDecimate, pixelWidth
+
+kinds = ("m5spec", "m5bstate")
+
+
+def description():
+
+    d = "A live display of the bandpasses (m5spec) and the 2-bit sampler statistics (m5bstate) "
+    d += "of the last scan. The figures are created once; new results are announced by "
+    d += "start_gmva.py as JSON lines on the standard input and only the plotted data is replaced."
+
+    return(d)
+
+def notify(stream, kind, path):
+    '''
+    Announces a new result file to the dashboard reading from stream (the
+    stdin of the dashboard process). kind is either m5spec or m5bstate.
+    Returns False if the dashboard is not running anymore.
+    '''
+
+    try:
+        stream.write(json.dumps({"kind": kind, "path": path}) + "\n")
+        stream.flush()
+    except (OSError, ValueError):
+        # broken pipe or closed stream
+        return False
+
+    return True
+
+def parseMessage(line):
+    '''
+    Returns the (kind, path) of an announcement. Raises ValueError if line
+    is not a valid announcement.
+    '''
+
+    message = json.loads(line)
+    if not isinstance(message, dict) or message.get("kind") not in kinds or not isinstance(message.get("path"), str):
+        raise ValueError("Not a result announcement: %s" % line.strip()[:80])
+
+    return (message["kind"], message["path"])
+
+
+class Dashboard:
+    '''
+    Keeps one figure with 4x4 bandpass plots and one with 4x4 state
+    histograms. The Line2D, bar and text artists are created once and
+    updated in place when new results arrive.
+    '''
+
+    numBands = 16
+
+    def __init__(self):
+
+        import matplotlib.pyplot as plt
+        self.plt = plt
+
+        plt.ion()
+        plt.rc("font", size=8)
+        hostname = socket.gethostname()
+
+        self.specFig, specAxes = plt.subplots(4, 4)
+        self.specFig.suptitle("%s: waiting for m5spec data" % hostname, fontsize=16)
+        self.specAxes = specAxes.ravel()
+        self.lines = []
+        for i, ax in enumerate(self.specAxes):
+            self.lines.append(ax.plot([], [])[0])
+            ax.set_title("band %d" % (i+1))
+        self.specFig.subplots_adjust(hspace=0.6, wspace=0.4)
+
+        self.bstateFig, bstateAxes = plt.subplots(4, 4)
+        self.bstateFig.suptitle("%s: waiting for m5bstate data" % hostname, fontsize=16)
+        self.bstateAxes = bstateAxes.ravel()
+        self.bars = []
+        self.labels = []
+        xLabels = ["- -", "-", "+", "++"]
+        xData = [0, 1, 2, 3]
+        for i, ax in enumerate(self.bstateAxes):
+            rects = ax.bar(xData, [0, 0, 0, 0], align='center', color="grey")
+            self.bars.append(rects)
+            self.labels.append([ax.text(x, 0, "", horizontalalignment='center', verticalalignment='center', clip_on=True, color="white") for x in xData])
+            ax.set_title("band %d" % (i+1))
+            ax.set_xticks(xData)
+            ax.set_xticklabels(xLabels)
+            ax.set_ylabel("%")
+            ax.set_ylim(0, 50)
+        self.bstateFig.subplots_adjust(hspace=0.6, wspace=0.4)
+
+        self.hostname = hostname
+
+    def showM5spec(self, path):
+
+        data = readM5spec(path)
+        x = data[:, 0]
+        for i, line in enumerate(self.lines):
+            if i + 1 >= data.shape[1]:
+                line.set_data([], [])
+                continue
+            ax = self.specAxes[i]
+            line.set_data(*minMaxDecimate(x, data[:, i+1], pixelWidth(ax)))
+            ax.relim()
+            ax.autoscale_view()
+        self.specFig.suptitle("%s: %s" % (self.hostname, path), fontsize=16)
+        self.specFig.canvas.draw_idle()
+
+    def showM5bstate(self, path):
+
+        for channel, counts, perc, gfact in readM5bstate(path):
+            if channel >= self.numBands:
+                continue
+            color = bstateColor(perc)
+            for rect, label, value in zip(self.bars[channel], self.labels[channel], perc):
+                rect.set_height(value)
+                rect.set_color(color)
+                label.set_y(value / 2.0)
+                label.set_text(value)
+        self.bstateFig.suptitle("%s: %s" % (self.hostname, path), fontsize=16)
+        self.bstateFig.canvas.draw_idle()
+
+    def run(self, stream=sys.stdin):
+        '''
+        Processes the results announced on stream until all figures are
+        closed.
+        '''
+
+        messages = queue.Queue()
+
+        def receive():
+            for line in stream:
+                if not line.strip():
+                    continue
+                try:
+                    messages.put(parseMessage(line))
+                except ValueError as e:
+                    print ("Ignoring invalid message (%s)" % e)
+
+        threading.Thread(target=receive, daemon=True).start()
+
+        # the GUI must be updated from the main thread
+        while self.plt.get_fignums():
+            while not messages.empty():
+                kind, path = messages.get()
+                try:
+                    if kind == "m5spec":
+                        self.showM5spec(path)
+                    else:
+                        self.showM5bstate(path)
+                except (OSError, ValueError) as e:
+                    print ("Could not display %s (%s)" % (path, e))
+            self.plt.pause(0.2)
+
+def main():
+
+    parser = argparse.ArgumentParser(description=description())
+    parser.parse_args()
+
+    Dashboard().run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+###########################################################################
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+
+import os
+import sys
+import glob
+import html
+import argparse
+import multiprocessing
+from collections import OrderedDict
+
+# file types of the experiment directory and the scripts rendering them
+fileTypes = ("m5spec", "m5bstate")
+
+
+def description():
+
+    d = "Renders all m5spec and m5bstate files of an experiment directory (e.g. /home/oper/GMVA/<exp>) "
+    d += "to png files in parallel and writes an html index page. Png files that are newer than "
+    d += "their source file are not rendered again."
+
+    return(d)
+
+def _initWorker():
+
+    # the workers only write files: use the non-interactive backend
+    import matplotlib
+    matplotlib.use("Agg")
+
+def renderFile(job):
+    '''
+    Renders one file to png. job is a (kind, source, png) tuple. Returns
+    (source, error message or None).
+    '''
+
+    kind, source, png = job
+
+    try:
+        if kind == "m5spec":
+            from plot_pfb_m5spec import plotM5spec
+            plotM5spec(source, png)
+        else:
+            from plot_m5bstate import plotM5bstate
+            plotM5bstate(source, png)
+    except Exception as e:
+        return (source, str(e))
+
+    return (source, None)
+
+def isUpToDate(source, png):
+
+    return os.path.exists(png) and os.path.getmtime(png) >= os.path.getmtime(source)
+
+def findFiles(expDir):
+    '''
+    Returns the result files of an experiment directory grouped by scan:
+    an ordered dict {scan: {kind: path}}.
+    '''
+
+    scans = {}
+    for kind in fileTypes:
+        for path in glob.glob(os.path.join(expDir, "*.%s" % kind)):
+            scan = os.path.basename(path)[:-len(kind)-1]
+            scans.setdefault(scan, {})[kind] = path
+
+    return OrderedDict(sorted(scans.items()))
+
+def pngName(path):
+
+    return os.path.basename(path) + ".png"
+
+def writeIndex(path, title, scans):
+    '''
+    Writes the html index page with one row per scan and one column per
+    file type. The thumbnails link to the full size images.
+    '''
+
+    with open(path, "w") as f:
+        f.write("<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n")
+        f.write("<title>%s</title>\n" % html.escape(title))
+        f.write("<style>td, th { padding: 4px; text-align: center; } img { width: 320px; }</style>\n")
+        f.write("</head>\n<body>\n<h1>%s</h1>\n<table>\n" % html.escape(title))
+        f.write("<tr><th>scan</th>%s</tr>\n" % "".join(["<th>%s</th>" % kind for kind in fileTypes]))
+        for scan, files in scans.items():
+            f.write("<tr><td>%s</td>" % html.escape(scan))
+            for kind in fileTypes:
+                if kind in files:
+                    png = html.escape(pngName(files[kind]), quote=True)
+                    f.write("<td><a href=\"%s\"><img src=\"%s\" alt=\"%s\"></a></td>" % (png, png, png))
+                else:
+                    f.write("<td>-</td>")
+            f.write("</tr>\n")
+        f.write("</table>\n</body>\n</html>\n")
+
+def makeReport(expDir, outDir=None, processes=None, force=False):
+    '''
+    Renders the outdated png files of an experiment directory and writes
+    the index page. Returns the number of rendered and failed files.
+    '''
+
+    if outDir is None:
+        outDir = os.path.join(expDir, "report")
+    if not os.path.isdir(outDir):
+        os.makedirs(outDir)
+
+    scans = findFiles(expDir)
+
+    jobs = []
+    for scan, files in scans.items():
+        for kind, source in files.items():
+            png = os.path.join(outDir, pngName(source))
+            if force or not isUpToDate(source, png):
+                jobs.append((kind, source, png))
+
+    print ("Rendering %d of %d files with %s processes" % (len(jobs), sum([len(f) for f in scans.values()]), processes or multiprocessing.cpu_count()))
+
+    failed = 0
+    if jobs:
+        with multiprocessing.Pool(processes, initializer=_initWorker) as pool:
+            for source, error in pool.imap_unordered(renderFile, jobs):
+                if error:
+                    failed += 1
+                    print ("Failed to render %s (%s)" % (source, error))
+
+    indexFile = os.path.join(outDir, "index.html")
+    writeIndex(indexFile, os.path.basename(os.path.normpath(expDir)), scans)
+    print ("Wrote %s" % indexFile)
+
+    return (len(jobs) - failed, failed)
+
+def main():
+
+    parser = argparse.ArgumentParser(description=description())
+    parser.add_argument("-o", "--output", dest="outDir", default=None, help="The directory for the png files and the index page (default: <experiment directory>/report).")
+    parser.add_argument("-p", "--processes", type=int, default=None, help="The number of rendering processes (default: number of cpus).")
+    parser.add_argument("-f", "--force", action="store_true", help="Render all files, also those with an up to date png file.")
+    parser.add_argument("expDir", type=str, help="The experiment directory containing the m5spec and m5bstate files.")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.expDir):
+        sys.exit("The experiment directory (%s) does not exist" % args.expDir)
+
+    rendered, failed = makeReport(args.expDir, args.outDir, args.processes, args.force)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+###########################################################################
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+'''
+Readers for the text files produced by the mark5access utilities.
+
+Parsed m5spec files are cached in a hidden .npy file next to the original
+file. The name of the cache file contains the size and modification time of
+the m5spec file, so a changed file is parsed again, while an unchanged file
+is loaded as a read-only memory map without any parsing.
+'''
+
+import os
+import re
+import tempfile
+import numpy as np
+
+
+#Ch    --      -     +     ++        --      -      +     ++     gfact
+# 0   17621   29602   29995   17782      18.5   31.2   31.6   18.7   0.98
+reM5bstate = re.compile(r"\s*(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+\.\d+)\s+(\d+\.\d+)\s+(\d+\.\d+)\s+(\d+\.\d+)\s+(\d+\.\d+)")
+
+
+def readM5spec(path, cache=True):
+    '''
+    Returns the contents of an m5spec file as a 2-D array of shape
+    (points, columns). The first column contains the frequency axis.
+    '''
+
+    if not cache:
+        return parseM5spec(path)
+
+    cacheFile = _cachePath(path)
+    if os.path.exists(cacheFile):
+        try:
+            return np.load(cacheFile, mmap_mode="r")
+        except (OSError, ValueError):
+            pass
+
+    data = parseM5spec(path)
+    _writeCache(path, cacheFile, data)
+
+    return data
+
+def parseM5spec(path):
+    '''
+    Parses an m5spec file without using the cache. path can also be an
+    open file object e.g. a pipe.
+    '''
+
+    # the loadtxt parser is implemented in C since numpy 1.23 and is faster
+    # than np.fromfile(sep=" ") for these files
+    return np.loadtxt(path, ndmin=2)
+
+def _cachePath(path):
+
+    stat = os.stat(path)
+    head, tail = os.path.split(path)
+
+    return os.path.join(head, ".%s.%d-%d.npy" % (tail, stat.st_size, stat.st_mtime_ns))
+
+def _writeCache(path, cacheFile, data):
+
+    head, tail = os.path.split(path)
+    try:
+        # remove caches of previous versions of the file, but not those of
+        # other files sharing the name as prefix (e.g. <name>.bak)
+        reStale = re.compile(r"\.%s\.\d+-\d+\.npy$" % re.escape(tail))
+        for name in os.listdir(head or "."):
+            if reStale.match(name):
+                os.remove(os.path.join(head, name))
+
+        # write to a temporary file first so that concurrent readers never see a partial cache
+        fd, tmpFile = tempfile.mkstemp(dir=head or ".", prefix=".%s." % tail, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, data)
+        os.chmod(tmpFile, 0o644)
+        os.replace(tmpFile, cacheFile)
+    except OSError:
+        # caching is optional e.g. for read-only directories
+        pass
+
+def writeM5spec(path, freq, spectra, cross=None):
+    '''
+    Writes spectra in the m5spec text format: the frequency [MHz] followed
+    by the power of every channel and, optionally, the real and imaginary
+    parts of the cross spectra.
+    '''
+
+    columns = [np.asarray(spectra).reshape(len(freq), -1)]
+    if cross is not None and np.size(cross) > 0:
+        cross = np.asarray(cross).reshape(len(freq), -1)
+        columns.append(np.stack([cross.real, cross.imag], axis=-1).reshape(len(freq), -1))
+    values = np.hstack(columns)
+
+    with open(path, "w") as f:
+        for i in range(len(freq)):
+            f.write("%f " % freq[i] + "".join(" %f" % v for v in values[i]) + "\n")
+
+def readM5bstate(path):
+    '''
+    Parses the output of m5bstate.
+    Returns a list of (channel, counts, percentages, gfact) tuples, with the
+    counts and percentages of the states --, -, +, ++ as lists.
+    '''
+
+    result = []
+    with open(path, "r") as f:
+        for line in f:
+            match = reM5bstate.match(line)
+            if match:
+                values = match.groups()
+                counts = [int(v) for v in values[1:5]]
+                perc = [float(v) for v in values[5:9]]
+                result.append((int(values[0]), counts, perc, float(values[9])))
+
+    return result
+
+def bstateColor(perc):
+    '''
+    Returns the color rating the state percentages (--, -, +, ++) against
+    the nominal distribution of 19/31/31/19 %: red if any state deviates by
+    more than 6%, orange if by more than 3%, otherwise green.
+    '''
+
+    deviation = max(abs(perc[0]-19), abs(perc[1]-31), abs(perc[2]-31), abs(perc[3]-19))
+    if deviation > 6:
+        return "red"
+    elif deviation > 3:
+        return "orange"
+    return "green"
+
+def writeM5bstate(path, counts):
+    '''
+    Writes the 2-bit state counts, an array of shape (channels, 4), in the
+    m5bstate text format.
+    '''
+
+    with open(path, "w") as f:
+        f.write("Ch    --      -     +     ++        --      -      +     ++     gfact\n")
+        for ch in range(len(counts)):
+            total = float(np.sum(counts[ch]))
+            perc = [100.0 * c / total for c in counts[ch]]
+            f.write("%2d %7d %7d %7d %7d    %6.1f %6.1f %6.1f %6.1f   %5.2f\n" % ((ch,) + tuple(counts[ch]) + tuple(perc) + (gainFactor(counts[ch]),)))
+
+def gainFactor(counts):
+    '''
+    Returns the ratio of the nominal sampler threshold to the threshold
+    derived from the fraction of high (-- and ++) states. The nominal
+    threshold corresponds to 19% of the samples in each of the high states.
+    '''
+
+    from statistics import NormalDist
+
+    total = float(np.sum(counts))
+    high = (counts[0] + counts[3]) / total
+    if high <= 0 or high >= 1:
+        return 0.0
+
+    normal = NormalDist()
+    return normal.inv_cdf(1 - 0.19) / normal.inv_cdf(1 - high / 2)
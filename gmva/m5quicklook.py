@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+###########################################################################
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+
+import sys
+import argparse
+import numpy as np
+
+import vdif
+from m5data import writeM5spec, writeM5bstate
+
+
+def description():
+
+    d = "Computes the bandpasses (like m5spec) and the 2-bit sampler statistics (like m5bstate) "
+    d += "of a VDIF file in a single pass over the data. Only the frames required for the "
+    d += "requested number of spectra are read. The output files have the m5spec and m5bstate "
+    d += "formats and can be displayed with plot_pfb_m5spec.py and plot_m5bstate.py."
+
+    return(d)
+
+def analyseVdif(path, dataFormat, numPoints, numInt, bstateFrames=100, offset=0):
+    '''
+    Takes the frames needed for numInt spectra with numPoints frequency points
+    per channel (but at least bstateFrames frames) from the VDIF file.
+    Returns a tuple (freq, spectra, cross, counts) with
+      freq     the frequency axis [MHz]
+      spectra  the power spectra of all channels (numPoints, channels)
+      cross    the cross spectra of channel pairs 1-2, 3-4, ... (numPoints, channels/2)
+      counts   the state counts of the first bstateFrames frames (channels, 4)
+    '''
+
+    fmt = vdif.parseFormat(dataFormat)
+    if fmt['nbits'] != 2:
+        raise ValueError("Only 2-bit data is supported")
+
+    nchan = fmt['nchan']
+    fftSize = 2 * numPoints
+    samplesPerFrame = fmt['payload'] * 8 // (nchan * fmt['nbits'])
+    numFrames = max(bstateFrames, -(-numInt * fftSize // samplesPerFrame))
+
+    vdifFile = vdif.VdifFile(path)
+    start = offset // vdifFile.frameBytes
+    codes = vdif.unpack2bit(vdifFile.payloads(start, numFrames), nchan)
+
+    # state counts for all channels at once
+    bstate = codes[:bstateFrames * samplesPerFrame]
+    counts = np.stack([np.count_nonzero(bstate == state, axis=0) for state in range(4)], axis=-1)
+
+    numInt = min(numInt, len(codes) // fftSize)
+    if numInt == 0:
+        raise ValueError("Not enough data in %s for a single spectrum" % path)
+
+    spectra = np.zeros((numPoints, nchan))
+    cross = np.zeros((numPoints, nchan // 2), dtype=complex)
+
+    # transform in blocks to limit the memory usage
+    block = 64
+    for start in range(0, numInt, block):
+        stop = min(start + block, numInt)
+        samples = vdif.levels2bit[codes[start * fftSize:stop * fftSize]]
+        samples = samples.reshape(stop - start, fftSize, nchan)
+        spec = np.fft.rfft(samples, axis=1)[:, :numPoints, :]
+        spectra += np.sum(np.abs(spec) ** 2, axis=0)
+        cross += np.sum(spec[:, :, 0:nchan - 1:2] * np.conj(spec[:, :, 1::2]), axis=0)
+
+    spectra /= numInt * numPoints
+    cross /= numInt * numPoints
+
+    bandwidth = vdif.sampleRate(fmt) / 2e6
+    freq = np.arange(numPoints) * bandwidth / numPoints
+
+    return (freq, spectra, cross, counts)
+
+def main():
+
+    parser = argparse.ArgumentParser(description=description())
+    parser.add_argument("-b", "--bstate-frames", type=int, default=100, dest="bstateFrames", help="The number of frames used for the state counts (default: %(default)s).")
+    parser.add_argument("-o", "--offset", type=int, default=0, help="The byte offset in the file from which to take the frames (default: %(default)s).")
+    parser.add_argument("vdif", type=str, help="The VDIF file")
+    parser.add_argument("format", type=str, help="The data format e.g. VDIF_5000-2048-16-2")
+    parser.add_argument("nchan", type=int, help="The number of spectral points per channel")
+    parser.add_argument("nint", type=int, help="The number of spectra to average")
+    parser.add_argument("m5spec", type=str, help="The output file for the spectra")
+    parser.add_argument("m5bstate", type=str, help="The output file for the state counts")
+
+    args = parser.parse_args()
+
+    try:
+        freq, spectra, cross, counts = analyseVdif(args.vdif, args.format, args.nchan, args.nint, args.bstateFrames, args.offset)
+    except (OSError, ValueError) as e:
+        sys.exit("Error: %s" % e)
+
+    writeM5spec(args.m5spec, freq, spectra, cross)
+    writeM5bstate(args.m5bstate, counts)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+###########################################################################
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+
+import os
+import time
+import shutil
+import tempfile
+import threading
+from collections import Counter, OrderedDict
+
+import mk6sg
+
+
+class FuseMount:
+    '''
+    Access to the scans of the disk pack in a recorder slot that can be
+    shared by several concurrent readers.
+
+    The disk pack is fuseMk6 mounted once, on first use, and stays mounted
+    until close() is called. fuseMk6 only lists the scans present at mount
+    time, and a remount rescans the whole module, which gets slower as the
+    module fills up. Scans recorded after the mount are therefore not
+    picked up by a remount: their scatter-gather files are read directly
+    (see mk6sg) and the first gatherBytes of the scan are written to a file
+    in spoolDir. Only the block headers of the new scan are read, so the
+    cost does not depend on the number of scans on the module. The
+    gathered files of the last keepGathered scans are kept for further
+    readers of the same scan.
+
+    The mount is checked before every use. A mount that does not respond
+    is remounted once its readers have released it. The lock is never
+    held during I/O (health check, mount, gathering), so a hanging fuse
+    mount only blocks the reader that touches it.
+
+    The duration of every mount and every gathered scan is recorded, see
+    metrics().
+    '''
+
+    def __init__(self, slot, mountPoint, healthTimeout=10, spoolDir=None, gatherBytes=64*1024*1024, keepGathered=2, diskRoot=mk6sg.diskRoot):
+
+        self.slot = slot
+        self.mountPoint = mountPoint
+        self.healthTimeout = healthTimeout
+        self.spoolDir = spoolDir
+        self.gatherBytes = gatherBytes
+        self.keepGathered = keepGathered
+        self.diskRoot = diskRoot
+        self.mounted = False
+        self.busy = False           # a mount or unmount is in progress
+        self.generation = 0         # incremented by every mount
+        self.readers = 0
+        self.leases = Counter()     # readers of the mount per path
+        self.gathered = OrderedDict()
+        self.latencies = []
+        self.gatherLatencies = []
+        self.cond = threading.Condition()
+        self._ownSpoolDir = spoolDir is None
+
+    def mount(self):
+        '''
+        Mounts the disk pack. Returns True if the mount point is mounted
+        afterwards.
+        '''
+
+        t0 = time.time()
+        os.system("fuseMk6 -r '%s/%d/*/data' %s" % (self.diskRoot, self.slot, self.mountPoint))
+        self.latencies.append(time.time() - t0)
+
+        print ("Mounted slot %d in %.1f s (mount #%d)" % (self.slot, self.latencies[-1], len(self.latencies)))
+
+        return os.path.ismount(self.mountPoint)
+
+    def umount(self):
+        os.system("fusermount -u %s" % self.mountPoint)
+        self.mounted = False
+
+    def healthy(self):
+        '''
+        Returns True if the mount point is mounted and responds within
+        healthTimeout seconds.
+        '''
+
+        if not os.path.ismount(self.mountPoint):
+            return False
+
+        # a hanging fuse file system blocks listdir, so check in a separate thread
+        result = []
+        def check():
+            try:
+                os.listdir(self.mountPoint)
+                result.append(True)
+            except OSError:
+                pass
+
+        checker = threading.Thread(target=check, daemon=True)
+        checker.start()
+        checker.join(self.healthTimeout)
+
+        return len(result) > 0
+
+    def acquire(self, path):
+        '''
+        Makes the scan path (under the mount point) readable and registers
+        the caller as a reader. Returns the file to read: path itself if the
+        scan is visible in the mount, otherwise a local file with the start
+        of the scan gathered from the scatter-gather files. Every acquire
+        must be followed by a release of the returned file.
+        '''
+
+        for attempt in range(2):
+            generation = self._register(path)
+            if generation is None:
+                # the disk pack could not be mounted
+                break
+            if self.healthy():
+                if os.path.exists(path):
+                    return path
+                self._unregister(path)
+                break
+            self._unregister(path)
+            print ("The fuse mount of slot %d is not responding. Remounting" % self.slot)
+            self._unmountStale(generation)
+
+        # e.g. a scan recorded after the mount: read it without a rescan of the module
+        gathered = self._gather(path)
+        if gathered is not None:
+            return gathered
+
+        # the scan is not on the module either: the reader fails as it would on the mount
+        return path
+
+    def release(self, path):
+
+        with self.cond:
+            if self.leases[path] > 0:
+                self._removeReader(path)
+            else:
+                entry = self.gathered.get(os.path.basename(path))
+                if entry is not None and entry['path'] == path:
+                    entry['readers'] -= 1
+            stale = self._staleGathered()
+            self.cond.notify_all()
+
+        for stalePath in stale:
+            self._remove(stalePath)
+
+    def close(self):
+
+        with self.cond:
+            while self.busy or self.readers > 0 or any([entry['readers'] > 0 for entry in self.gathered.values()]):
+                self.cond.wait()
+            stale = [entry['path'] for entry in self.gathered.values()]
+            self.gathered.clear()
+
+        self.umount()
+        for stalePath in stale:
+            self._remove(stalePath)
+        if self._ownSpoolDir and self.spoolDir:
+            shutil.rmtree(self.spoolDir, ignore_errors=True)
+            self.spoolDir = None
+
+    def metrics(self):
+        '''
+        Returns the mount statistics: number of mounts and the last, mean
+        and maximum mount latency [s], the number of scans gathered from the
+        scatter-gather files and their mean gather time [s].
+        '''
+
+        result = {'mounts': len(self.latencies), 'last': None, 'mean': None, 'max': None, 'gathered': len(self.gatherLatencies), 'gatherMean': None}
+        if self.latencies:
+            result.update({'last': self.latencies[-1], 'mean': sum(self.latencies) / len(self.latencies), 'max': max(self.latencies)})
+        if self.gatherLatencies:
+            result['gatherMean'] = sum(self.gatherLatencies) / len(self.gatherLatencies)
+
+        return result
+
+    def _register(self, path):
+        '''
+        Registers a reader of the mount, mounting the disk pack first if
+        needed. Returns the mount generation or None if the disk pack could
+        not be mounted.
+        '''
+
+        with self.cond:
+            while self.busy:
+                self.cond.wait()
+            if self.mounted:
+                return self._addReader(path)
+            self.busy = True
+
+        mounted = False
+        try:
+            mounted = self.mount()
+        finally:
+            with self.cond:
+                self.busy = False
+                self.mounted = mounted
+                if mounted:
+                    self.generation += 1
+                self.cond.notify_all()
+
+        if not mounted:
+            print ("Could not mount slot %d" % self.slot)
+            return None
+
+        with self.cond:
+            return self._addReader(path)
+
+    def _addReader(self, path):
+
+        self.readers += 1
+        self.leases[path] += 1
+        return self.generation
+
+    def _removeReader(self, path):
+
+        self.leases[path] -= 1
+        if self.leases[path] <= 0:
+            del self.leases[path]
+        self.readers -= 1
+
+    def _unregister(self, path):
+
+        with self.cond:
+            self._removeReader(path)
+            self.cond.notify_all()
+
+    def _unmountStale(self, generation):
+
+        with self.cond:
+            # a slow listdir under load must not pull the mount away from a running reader
+            while self.busy or self.readers > 0:
+                self.cond.wait()
+            if not self.mounted or self.generation != generation:
+                # already remounted by another reader
+                return
+            self.busy = True
+
+        try:
+            self.umount()
+        finally:
+            with self.cond:
+                self.busy = False
+                self.mounted = False
+                self.cond.notify_all()
+
+    def _gather(self, path):
+        '''
+        Returns a local file with the start of the scan path gathered from
+        the scatter-gather files, or None if the scan is not on the module.
+        Concurrent readers of the same scan share one gathered file.
+        '''
+
+        name = os.path.basename(path)
+        with self.cond:
+            entry = self.gathered.get(name)
+            if entry is not None:
+                while not entry['ready']:
+                    self.cond.wait()
+                if entry['path'] is None:
+                    return None
+                entry['readers'] += 1
+                self.gathered.move_to_end(name)
+                return entry['path']
+            entry = self.gathered[name] = {'path': None, 'readers': 1, 'ready': False}
+            if self.spoolDir is None:
+                self.spoolDir = tempfile.mkdtemp(prefix="gmva-sg-")
+
+        gatheredPath = None
+        try:
+            files = mk6sg.scanFiles(self.slot, name, self.diskRoot)
+            if files:
+                t0 = time.time()
+                outPath = os.path.join(self.spoolDir, name)
+                size = mk6sg.gather(files, outPath, self.gatherBytes)
+                self.gatherLatencies.append(time.time() - t0)
+                gatheredPath = outPath
+                print ("Read %.1f MB of %s from %d disks in %.1f s" % (size / 1e6, name, len(files), self.gatherLatencies[-1]))
+            else:
+                print ("Scan %s not found on the module in slot %d" % (name, self.slot))
+        except (OSError, ValueError) as e:
+            print ("Could not read %s from the module in slot %d (%s)" % (name, self.slot, e))
+        finally:
+            with self.cond:
+                entry['ready'] = True
+                entry['path'] = gatheredPath
+                if gatheredPath is None:
+                    del self.gathered[name]
+                self.cond.notify_all()
+
+        return gatheredPath
+
+    def _staleGathered(self):
+
+        # the oldest gathered files without readers beyond the last keepGathered scans
+        stale = []
+        for name in list(self.gathered):
+            if len(self.gathered) <= self.keepGathered:
+                break
+            entry = self.gathered[name]
+            if entry['ready'] and entry['readers'] <= 0:
+                stale.append(entry['path'])
+                del self.gathered[name]
+
+        return stale
+
+    def _remove(self, path):
+
+        try:
+            os.remove(path)
+        except OSError:
+            pass
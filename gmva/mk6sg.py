@@ -0,0 +1,129 @@
+###########################################################################
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+'''
+Direct access to the Mark6 scatter-gather files of a single scan.
+
+The Mark6 records a scan as one file per disk of the module
+(<diskRoot>/<slot>/<disk>/data/<scan>). Every file starts with a file
+header followed by blocks; each block header holds the number of the block
+in the recorded stream and (version 2) the size of the block. Sorting the
+blocks of all files by their number restores the recorded VDIF stream.
+
+Only the block headers of the files of the requested scan are read, so the
+cost does not depend on the number of scans on the module (unlike a
+fuseMk6 mount, which lists all scans).
+'''
+
+import os
+import glob
+import struct
+
+diskRoot = "/mnt/disks"
+
+syncWord = 0xfeed6666
+# sync word, version, block size, packet format, packet size
+fileHeader = struct.Struct("<Iiiii")
+# block number (version 1); block number and block size incl. header (version 2)
+blockHeaders = {1: struct.Struct("<i"), 2: struct.Struct("<ii")}
+
+copyBytes = 4 * 1024 * 1024
+
+
+def scanFiles(slot, scanName, root=diskRoot):
+    '''
+    Returns the scatter-gather files of a scan on the module in the given
+    slot.
+    '''
+
+    return sorted(glob.glob(os.path.join(root, str(slot), "*", "data", glob.escape(scanName))))
+
+def readBlockList(path):
+    '''
+    Reads the file header and the block headers of a scatter-gather file.
+    Returns (header, blocks) with header a dict of the file header fields
+    and blocks a list of (block number, data offset, data size) tuples.
+    '''
+
+    with open(path, "rb") as f:
+        raw = f.read(fileHeader.size)
+        if len(raw) < fileHeader.size:
+            raise ValueError("No scatter-gather header in %s" % path)
+        sync, version, blockSize, packetFormat, packetSize = fileHeader.unpack(raw)
+        if sync != syncWord or version not in blockHeaders:
+            raise ValueError("Not a scatter-gather file (version 1 or 2): %s" % path)
+
+        header = {'version': version, 'blockSize': blockSize, 'packetFormat': packetFormat, 'packetSize': packetSize}
+        blockHeader = blockHeaders[version]
+        fileSize = os.fstat(f.fileno()).st_size
+
+        blocks = []
+        pos = fileHeader.size
+        while pos + blockHeader.size <= fileSize:
+            f.seek(pos)
+            fields = blockHeader.unpack(f.read(blockHeader.size))
+            size = fields[1] if version == 2 else blockSize
+            if size <= blockHeader.size:
+                break
+            # the last block of a scan still being written may be incomplete
+            dataSize = min(size, fileSize - pos) - blockHeader.size
+            blocks.append((fields[0], pos + blockHeader.size, dataSize))
+            pos += size
+
+    return (header, blocks)
+
+def gather(files, outPath, maxBytes=None):
+    '''
+    Writes the VDIF stream recorded in the scatter-gather files to outPath,
+    at most maxBytes (rounded down to whole packets). Returns the number of
+    bytes written.
+    '''
+
+    blocks = []
+    packetSize = None
+    for path in files:
+        header, fileBlocks = readBlockList(path)
+        packetSize = packetSize or header['packetSize']
+        blocks.extend((number, path, offset, size) for number, offset, size in fileBlocks)
+    blocks.sort()
+
+    if maxBytes is not None and packetSize:
+        maxBytes -= maxBytes % packetSize
+
+    written = 0
+    handles = {}
+    try:
+        with open(outPath, "wb") as out:
+            for number, path, offset, size in blocks:
+                if maxBytes is not None:
+                    size = min(size, maxBytes - written)
+                    if size <= 0:
+                        break
+                f = handles.get(path)
+                if f is None:
+                    f = handles[path] = open(path, "rb")
+                f.seek(offset)
+                while size > 0:
+                    chunk = f.read(min(size, copyBytes))
+                    if not chunk:
+                        break
+                    out.write(chunk)
+                    written += len(chunk)
+                    size -= len(chunk)
+    finally:
+        for f in handles.values():
+            f.close()
+
+    return written
@@ -20,10 +20,10 @@
 
 import sys
 import os
-import re
 import socket
 from optparse import OptionParser
-import matplotlib.pyplot as plt
+
+from m5data import readM5bstate, bstateColor
 
 version = "1.0"
 
@@ -36,15 +36,12 @@ def usage():
 	return(usage)
 
 
-def plotM5bstate(infile):
-	
-	file = open(infile, "r")
-	bandData = {}
-	for i in range(16):
-		bandData[str(i+1)] = []
-	
-#Ch    --      -     +     ++        --      -      +     ++     gfact
-# 0   17621   29602   29995   17782      18.5   31.2   31.6   18.7   0.98
+def plotM5bstate(infile, pngPath=None):
+	'''
+	Displays the plot or, if pngPath is given, saves it to a png file.
+	'''
+
+	import matplotlib.pyplot as plt
 
 	hostname = socket.gethostname()
 	fig = plt.figure()
@@ -55,58 +52,53 @@ def plotM5bstate(infile):
 	xLabels = ["- -", "-", "+", "++"]
 	xData = [0,1,2,3]
 
-	reM5bstate = re.compile("\s*(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+\.\d+)\s+(\d+\.\d+)\s+(\d+\.\d+)\s+(\d+\.\d+)\s+(\d+\.\d+)")
-	for line in file:
-		match = reM5bstate.match(line)
-		if match:
-			ydata = [float(match.group(6)),float(match.group(7)),float(match.group(8)),float(match.group(9))] 
-			# check quality of bit statistics
-			if abs(ydata[0]-19) > 6 or abs(ydata[3]-19) > 6 or abs(ydata[1]-31) > 6 or abs(ydata[2]-31) > 6:
-				color = "red"
-			elif abs(ydata[0]-19) > 3 or abs(ydata[3]-19) > 3 or abs(ydata[1]-31) > 3 or abs(ydata[2]-31) > 3:
-                                color = "orange"
-			else:
-				color = "green"
-	 		plt.subplot(4,4,int(match.group(1))+1)
-	 		rects = plt.bar(xData,ydata, align='center', color=color)
-	 		plt.title ("band %d" % (int(match.group(1))+1))
-			plt.xticks(xData, xLabels)
-			plt.ylabel("%")
-	 		plt.subplots_adjust(hspace=0.6,wspace=0.4)
-			count = 0
-			for rect in rects:
-        			width = int(rect.get_width())
-				xloc = rect.get_x() + rect.get_width()/2.0
-				yloc = rect.get_y() + rect.get_height()/2.0
-				perc = ydata[count]
-				label = plt.text(xloc, yloc, perc, horizontalalignment='center', verticalalignment='center', clip_on=True, color="white")
-				count +=1
-				
-			
-	plt.show()
-			
-	file.close() 
-
-
-# MAIN
-parser = OptionParser(usage=usage(),version=version)
-
-
-(options, args) = parser.parse_args()
-
-if len(args) != 1:
-	parser.print_help()
-	sys.exit(1)
-
-infile = args[0]
-
-# check that input  file exists
-if not os.path.exists(infile):
-	sys.exit("input file (%s) does not exist" % (infile))
-
-# read m5spec output and plot
-plotM5bstate(infile)
+	for channel, counts, ydata, gfact in readM5bstate(infile):
+		# check quality of bit statistics
+		color = bstateColor(ydata)
+		plt.subplot(4,4,channel+1)
+		rects = plt.bar(xData,ydata, align='center', color=color)
+		plt.title ("band %d" % (channel+1))
+		plt.xticks(xData, xLabels)
+		plt.ylabel("%")
+		plt.subplots_adjust(hspace=0.6,wspace=0.4)
+		count = 0
+		for rect in rects:
+			xloc = rect.get_x() + rect.get_width()/2.0
+			yloc = rect.get_y() + rect.get_height()/2.0
+			perc = ydata[count]
+			label = plt.text(xloc, yloc, perc, horizontalalignment='center', verticalalignment='center', clip_on=True, color="white")
+			count +=1
+
+	if pngPath:
+		fig.savefig(pngPath)
+		plt.close(fig)
+	else:
+		plt.show()
+
+
+def main():
+
+	parser = OptionParser(usage=usage(),version=version)
+	parser.add_option("-o", "--png", dest="pngPath", default=None, help="save the plot to the given png file instead of displaying it")
+
+	(options, args) = parser.parse_args()
+
+	if len(args) != 1:
+		parser.print_help()
+		sys.exit(1)
+
+	infile = args[0]
 
+	# check that input  file exists
+	if not os.path.exists(infile):
+		sys.exit("input file (%s) does not exist" % (infile))
 
+	# read m5spec output and plot
+	if options.pngPath:
+		import matplotlib
+		matplotlib.use("Agg")
+	plotM5bstate(infile, options.pngPath)
 
 
+if __name__ == "__main__":
+	main()
@@ -22,7 +22,9 @@ import sys
 import os
 import socket
 from optparse import OptionParser
-import matplotlib.pyplot as plt
+
+from m5data import readM5spec
+from decimate import minMaxDecimate, pixelWidth
 
 version = "1.0"
 
@@ -36,54 +38,57 @@ def usage():
 	return(usage)
 
 
-def plotM5spec(infile):
-	
-	file = open(infile, "r")
-	xData = []
-	bandData = {}
-	for i in range(16):
-		bandData[str(i+1)] = []
-	
-	for line in file:
-		cols = line.split(" ")
-		xData.append(cols[0])
-		for i in range(16):
-			bandData[str(i+1)].append(cols[i+2])
-			
-	file.close()
+def plotM5spec(infile, pngPath=None):
+	'''
+	Displays the plot or, if pngPath is given, saves it to a png file.
+	'''
+
+	import matplotlib.pyplot as plt
+
+	data = readM5spec(infile)
+	xData = data[:,0]
 
-	
 	hostname = socket.gethostname()
 	fig = plt.figure()
 	plt.rc("font", size=8)
 	fig.suptitle("%s: %s" % (hostname, infile), fontsize=16)
+	plt.subplots_adjust(hspace=0.6,wspace=0.4)
 	for i in range(16):
-		plt.subplot(4,4,i+1)
-		plt.plot(xData,bandData[str(i+1)])
+		ax = plt.subplot(4,4,i+1)
+		# reduce the trace to about the width of the subplot
+		x, y = minMaxDecimate(xData, data[:,i+1], pixelWidth(ax))
+		plt.plot(x, y)
 		plt.title ("band " + str(i+1))
-		plt.subplots_adjust(hspace=0.6,wspace=0.4)
-	plt.show()
-
-
-# MAIN
-parser = OptionParser(usage=usage(),version=version)
+	if pngPath:
+		fig.savefig(pngPath)
+		plt.close(fig)
+	else:
+		plt.show()
 
 
-(options, args) = parser.parse_args()
+def main():
 
-if len(args) != 1:
-	parser.print_help()
-	sys.exit(1)
+	parser = OptionParser(usage=usage(),version=version)
+	parser.add_option("-o", "--png", dest="pngPath", default=None, help="save the plot to the given png file instead of displaying it")
 
-infile = args[0]
+	(options, args) = parser.parse_args()
 
-# check that input m5spec file exists
-if not os.path.exists(infile):
-	sys.exit("input file (%s) does not exist" % (infile))
+	if len(args) != 1:
+		parser.print_help()
+		sys.exit(1)
 
-# read m5spec output and plot
-plotM5spec(infile)
+	infile = args[0]
 
+	# check that input m5spec file exists
+	if not os.path.exists(infile):
+		sys.exit("input file (%s) does not exist" % (infile))
 
+	# read m5spec output and plot
+	if options.pngPath:
+		import matplotlib
+		matplotlib.use("Agg")
+	plotM5spec(infile, options.pngPath)
 
 
+if __name__ == "__main__":
+	main()
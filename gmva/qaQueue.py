@@ -0,0 +1,94 @@
+###########################################################################
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+
+import sys
+import threading
+import traceback
+from collections import deque
+
+
+class QAQueue:
+    '''
+    Executes post-scan QA jobs in the background.
+
+    At most maxWorkers jobs run at the same time. The QA tools (m5spec,
+    m5bstate) are external programs, so each worker only waits for its
+    child process. Jobs waiting for a free worker are kept in a backlog of
+    at most maxBacklog entries. When a job is submitted to a full backlog the
+    oldest waiting job is dropped, so the QA always follows the most recent
+    scans and never holds up the schedule.
+    '''
+
+    def __init__(self, maxWorkers=2, maxBacklog=4):
+
+        self.backlog = deque()
+        self.maxBacklog = maxBacklog
+        self.dropped = 0
+        self.cond = threading.Condition()
+        self.stopping = False
+        self.workers = []
+
+        for i in range(maxWorkers):
+            worker = threading.Thread(target=self._work, name="qa-%d" % i, daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, name, func, *args):
+        '''
+        Queues func(*args) for execution. name is used for log messages.
+        '''
+
+        with self.cond:
+            if len(self.backlog) >= self.maxBacklog:
+                oldName, oldFunc, oldArgs = self.backlog.popleft()
+                self.dropped += 1
+                print ("QA backlog full. Dropping job: %s" % oldName)
+            self.backlog.append((name, func, args))
+            self.cond.notify()
+
+    def pending(self):
+
+        with self.cond:
+            return len(self.backlog)
+
+    def shutdown(self, wait=True):
+        '''
+        Stops the workers after the backlog has been processed.
+        '''
+
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+
+        if wait:
+            for worker in self.workers:
+                worker.join()
+
+    def _work(self):
+
+        while True:
+            with self.cond:
+                while not self.backlog and not self.stopping:
+                    self.cond.wait()
+                if not self.backlog:
+                    return
+                name, func, args = self.backlog.popleft()
+
+            try:
+                func(*args)
+            except Exception:
+                print ("QA job %s failed" % name)
+                traceback.print_exc(file=sys.stdout)
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+###########################################################################
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+'''
+A database of the per-scan QA results.
+
+For every scan the bandpass summary of each channel (from m5spec) and the
+2-bit state percentages and gain factor of each channel (from m5bstate)
+are stored in an SQLite database. The results are indexed by experiment,
+scan and channel, so trends of a channel across an experiment are
+obtained without parsing the result files again.
+'''
+
+import os
+import glob
+import sqlite3
+import argparse
+import threading
+import numpy as np
+
+from m5data import readM5spec, readM5bstate
+
+schema = '''
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY,
+    experiment TEXT NOT NULL,
+    station TEXT NOT NULL,
+    scan TEXT NOT NULL,
+    time REAL,
+    UNIQUE (experiment, station, scan)
+);
+CREATE INDEX IF NOT EXISTS scans_time ON scans (experiment, time);
+CREATE TABLE IF NOT EXISTS bandpass (
+    scan_id INTEGER NOT NULL REFERENCES scans (id),
+    channel INTEGER NOT NULL,
+    mean REAL, std REAL, median REAL, min REAL, max REAL,
+    PRIMARY KEY (scan_id, channel)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS bstate (
+    scan_id INTEGER NOT NULL REFERENCES scans (id),
+    channel INTEGER NOT NULL,
+    mm REAL, m REAL, p REAL, pp REAL, gfact REAL,
+    PRIMARY KEY (scan_id, channel)
+) WITHOUT ROWID;
+'''
+
+bandpassColumns = ("mean", "std", "median", "min", "max")
+bstateColumns = ("mm", "m", "p", "pp", "gfact")
+
+
+def bandpassSummary(data, numChannels=16):
+    '''
+    Returns the bandpass summary of the auto spectra (columns 1 to
+    numChannels) of m5spec data as an array of shape (channels, 5): mean,
+    standard deviation, median, minimum and maximum power. NaN values are
+    ignored.
+    '''
+
+    spectra = np.asarray(data, dtype=float)[:, 1:numChannels+1]
+
+    return np.column_stack([np.nanmean(spectra, axis=0), np.nanstd(spectra, axis=0), np.nanmedian(spectra, axis=0), np.nanmin(spectra, axis=0), np.nanmax(spectra, axis=0)])
+
+def parseResultName(path):
+    '''
+    Splits the name of a result file (<exp>_<station>_<scan>.<ext>) into
+    experiment, station and scan name.
+    '''
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    parts = name.split("_", 2)
+    if len(parts) != 3:
+        raise ValueError("Cannot parse the name of the result file: %s" % path)
+
+    return tuple(parts)
+
+
+class QAStore:
+    '''
+    The QA database. The store can be shared by several threads (e.g. the
+    QA workers of start_gmva); every ingest is a single transaction.
+    '''
+
+    def __init__(self, path):
+
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        # WAL allows reading e.g. trends while a scan is ingested
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(schema)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+
+        with self.lock:
+            self.conn.close()
+
+    def _scanId(self, experiment, station, scan, time):
+
+        self.conn.execute("INSERT OR IGNORE INTO scans (experiment, station, scan, time) VALUES (?, ?, ?, ?)", (experiment, station, scan, time))
+        if time is not None:
+            self.conn.execute("UPDATE scans SET time = ? WHERE experiment = ? AND station = ? AND scan = ?", (time, experiment, station, scan))
+
+        return self.conn.execute("SELECT id FROM scans WHERE experiment = ? AND station = ? AND scan = ?", (experiment, station, scan)).fetchone()[0]
+
+    def addBandpass(self, experiment, station, scan, time, summary):
+        '''
+        Stores the bandpass summary (see bandpassSummary) of a scan. time is
+        the scan start in seconds since 1970.
+        '''
+
+        with self.lock, self.conn:
+            scanId = self._scanId(experiment, station, scan, time)
+            self.conn.executemany("INSERT OR REPLACE INTO bandpass VALUES (?, ?, ?, ?, ?, ?, ?)", [(scanId, channel) + tuple(float(v) for v in row) for channel, row in enumerate(summary)])
+
+    def addBstate(self, experiment, station, scan, time, records):
+        '''
+        Stores the state statistics of a scan as returned by readM5bstate.
+        '''
+
+        with self.lock, self.conn:
+            scanId = self._scanId(experiment, station, scan, time)
+            self.conn.executemany("INSERT OR REPLACE INTO bstate VALUES (?, ?, ?, ?, ?, ?, ?)", [(scanId, channel) + tuple(perc) + (gfact,) for channel, counts, perc, gfact in records])
+
+    def ingestM5spec(self, path, time=None, numChannels=16):
+        '''
+        Parses an m5spec result file and stores its bandpass summary.
+        '''
+
+        experiment, station, scan = parseResultName(path)
+        self.addBandpass(experiment, station, scan, time, bandpassSummary(readM5spec(path), numChannels))
+
+    def ingestM5bstate(self, path, time=None):
+        '''
+        Parses an m5bstate result file and stores its state statistics.
+        '''
+
+        experiment, station, scan = parseResultName(path)
+        self.addBstate(experiment, station, scan, time, readM5bstate(path))
+
+    def _trend(self, table, columns, experiment, channel, station):
+
+        query = "SELECT s.scan, s.station, s.time, %s FROM scans s JOIN %s t ON t.scan_id = s.id WHERE s.experiment = ? AND t.channel = ?" % (", ".join(["t." + c for c in columns]), table)
+        params = [experiment, channel]
+        if station is not None:
+            query += " AND s.station = ?"
+            params.append(station)
+        query += " ORDER BY s.time, s.scan"
+
+        with self.lock:
+            return self.conn.execute(query, params).fetchall()
+
+    def bstateTrend(self, experiment, channel, station=None):
+        '''
+        Returns the state percentages and gain factor of one channel for all
+        scans of an experiment as a list of (scan, station, time, --, -, +,
+        ++, gfact) tuples ordered by time.
+        '''
+
+        return self._trend("bstate", bstateColumns, experiment, channel, station)
+
+    def bandpassTrend(self, experiment, channel, station=None):
+        '''
+        Returns the bandpass summary of one channel for all scans of an
+        experiment as a list of (scan, station, time, mean, std, median,
+        min, max) tuples ordered by time.
+        '''
+
+        return self._trend("bandpass", bandpassColumns, experiment, channel, station)
+
+    def experiments(self):
+
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT DISTINCT experiment FROM scans ORDER BY experiment")]
+
+
+def description():
+
+    d = "Stores the m5spec and m5bstate results of an experiment directory in the QA database "
+    d += "(ingest) or prints the trend of one channel across an experiment (trend)."
+
+    return(d)
+
+def main():
+
+    parser = argparse.ArgumentParser(description=description())
+    parser.add_argument("database", type=str, help="The QA database file.")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    ingest = subparsers.add_parser("ingest", help="Store all result files of an experiment directory. The scan time is taken from the file modification time.")
+    ingest.add_argument("expDir", type=str, help="The experiment directory containing the m5spec and m5bstate files.")
+
+    trend = subparsers.add_parser("trend", help="Print the trend of one channel.")
+    trend.add_argument("-b", "--bandpass", action="store_true", help="Print the bandpass summary instead of the state statistics.")
+    trend.add_argument("-s", "--station", default=None, help="Only show the given station.")
+    trend.add_argument("experiment", type=str)
+    trend.add_argument("channel", type=int, help="The channel number (starting at 0).")
+
+    args = parser.parse_args()
+
+    with QAStore(args.database) as store:
+        if args.command == "ingest":
+            count = 0
+            for kind, ingestFile in (("m5spec", store.ingestM5spec), ("m5bstate", store.ingestM5bstate)):
+                for path in sorted(glob.glob(os.path.join(args.expDir, "*.%s" % kind))):
+                    try:
+                        ingestFile(path, os.path.getmtime(path))
+                        count += 1
+                    except (OSError, ValueError) as e:
+                        print ("Skipping %s (%s)" % (path, e))
+            print ("Ingested %d files" % count)
+        else:
+            if args.bandpass:
+                rows = store.bandpassTrend(args.experiment, args.channel, args.station)
+                columns = bandpassColumns
+            else:
+                rows = store.bstateTrend(args.experiment, args.channel, args.station)
+                columns = ("--", "-", "+", "++", "gfact")
+            print ("%-12s %-4s %-10s " % ("scan", "st", "time") + " ".join(["%8s" % c for c in columns]))
+            for row in rows:
+                print ("%-12s %-4s %10.0f " % (row[0], row[1], row[2] or 0) + " ".join(["%8.2f" % v for v in row[3:]]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+###########################################################################
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+'''
+Event scheduling for the tasks executed in the scan gaps.
+
+The events are kept in a heap ordered timer queue (sched.scheduler). The
+clock and the sleep function can be replaced e.g. by a simulated clock for
+testing.
+'''
+
+import sched
+import time
+from datetime import datetime, timedelta
+
+from schedule import firstFuture, stopTimes
+
+
+class SimulatedClock:
+    '''
+    A clock that only advances when sleep() is called.
+    '''
+
+    def __init__(self, now=0.0):
+        self.now = float(now)
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += max(0.0, seconds)
+
+
+def buildScheduler(scans, margin, action, clock=time.time, sleep=time.sleep):
+    '''
+    Returns a scheduler with one event for each scan of the schedule array
+    scans (see schedule.readSchedule) at its stop time plus margin
+    seconds. The event calls action(scanIdx, scan) with the scan record.
+
+    Scans that have ended before the scheduler is built (late start) are
+    skipped without visiting them one by one. Events that become overdue
+    while the scheduler is running (e.g. because a previous action took too
+    long) are executed as soon as possible in their original order.
+    '''
+
+    scheduler = sched.scheduler(clock, sleep)
+    now = clock()
+
+    first = firstFuture(scans, now)
+    if first > 0:
+        print ("%d scans lie in the past. Skipping" % first)
+
+    stop = stopTimes(scans)
+    for scanIdx in range(first, len(scans)):
+        # a scan overlapped by a longer previous scan may have ended as well
+        if stop[scanIdx] < now:
+            continue
+        scheduler.enterabs(stop[scanIdx] + margin, scanIdx, action, (scanIdx, scans[scanIdx]))
+
+    return scheduler
+
+def upcoming(scheduler):
+    '''
+    Returns the upcoming events as a list of (UTC datetime, scan name) tuples.
+    '''
+
+    return [(datetime(1970, 1, 1) + timedelta(seconds=event.time), str(event.argument[1]['scan'])) for event in scheduler.queue]
@@ -0,0 +1,101 @@
+###########################################################################
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+'''
+Reader for the xml schedules of M6_CC (as written by vex2xml.py).
+
+The scans are read incrementally (iterparse) into a structured array
+sorted by start time, with the start times converted to seconds since
+1970 once. The first scan that has not ended yet is found by binary
+search.
+'''
+
+import xml.etree.ElementTree as ET
+import numpy as np
+
+
+def scheduleDtype(nameLen=16, expLen=16, stationLen=8):
+    '''
+    Returns the record type of the schedule array. The string fields are
+    sized to the longest value of a schedule.
+    '''
+
+    return np.dtype([
+        ('start', 'f8'),                  # scan start [s since 1970]
+        ('duration', 'i4'),               # [s]
+        ('scan', 'U%d' % nameLen),
+        ('experiment', 'U%d' % expLen),
+        ('station', 'U%d' % stationLen),
+    ])
+
+def startEpochs(startTimes):
+    '''
+    Converts start times in the YYYYDDDHHMMSS format of the xml schedules
+    into seconds since 1970.
+    '''
+
+    fields = np.array([(t[0:4], t[4:7], t[7:9], t[9:11], t[11:13]) for t in startTimes], dtype=np.int64).reshape(-1, 5)
+    days = (fields[:, 0] - 1970).astype('datetime64[Y]').astype('datetime64[D]').astype(np.int64) + fields[:, 1] - 1
+
+    return (days * 86400 + fields[:, 2] * 3600 + fields[:, 3] * 60 + fields[:, 4]).astype(np.float64)
+
+def readSchedule(path):
+    '''
+    Reads the scan elements of an xml schedule. Returns a structured array
+    (see scheduleDtype) sorted by start time.
+    '''
+
+    starts = []
+    records = []
+    root = None
+    for event, elem in ET.iterparse(path, events=("start", "end")):
+        if root is None:
+            root = elem
+        if event != "end" or elem.tag != "scan":
+            continue
+        starts.append(elem.get('start_time'))
+        records.append((int(elem.get('duration')), elem.get('scan_name', ""), elem.get('experiment', ""), elem.get('station_code', "")))
+        # drop the parsed scan elements, so the tree never grows
+        root.clear()
+
+    def longest(i):
+        return max([len(r[i]) for r in records] + [1])
+
+    schedule = np.zeros(len(records), dtype=scheduleDtype(longest(1), longest(2), longest(3)))
+    if records:
+        schedule['start'] = startEpochs(starts)
+        duration, scan, experiment, station = zip(*records)
+        schedule['duration'] = duration
+        schedule['scan'] = scan
+        schedule['experiment'] = experiment
+        schedule['station'] = station
+
+    return schedule[np.argsort(schedule['start'], kind='stable')]
+
+def stopTimes(schedule):
+    return schedule['start'] + schedule['duration']
+
+def firstFuture(schedule, now, margin=0):
+    '''
+    Returns the index of the first scan that has not ended (plus margin
+    seconds) at time now [s since 1970], or len(schedule) if all scans have
+    ended. Scans are assumed not to overlap: a scan overlapped by a longer
+    earlier scan can be returned even if it has ended itself.
+    '''
+
+    # running maximum of the stop times: sorted even if scans overlap
+    stop = np.maximum.accumulate(stopTimes(schedule)) if len(schedule) else stopTimes(schedule)
+
+    return int(np.searchsorted(stop + margin, now, side='left'))
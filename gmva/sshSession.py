@@ -0,0 +1,133 @@
+###########################################################################
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+
+import os
+import shutil
+import tempfile
+import subprocess
+
+
+class SshSession:
+    '''
+    A persistent ssh connection to a remote host.
+
+    One master connection is opened (OpenSSH ControlMaster) and all
+    subsequent commands and file transfers are multiplexed over it, so the
+    ssh handshake is only done once. If the master connection can not be
+    established the commands fall back to individual connections.
+
+    The transport is the object used to spawn the ssh and scp processes. It
+    must provide run() and Popen() with the signatures of the subprocess
+    module and can be replaced by a fake transport for testing.
+    '''
+
+    def __init__(self, host, user=None, persist=600, transport=subprocess):
+
+        self.host = host
+        self.user = user
+        self.persist = persist
+        self.transport = transport
+        self.controlDir = None
+        self.controlPath = None
+
+    def destination(self):
+
+        if self.user:
+            return "%s@%s" % (self.user, self.host)
+        return self.host
+
+    def options(self):
+        '''
+        Returns the ssh options selecting the shared connection
+        '''
+
+        if not self.controlPath:
+            return []
+        return ["-o", "ControlMaster=no", "-o", "ControlPath=%s" % self.controlPath]
+
+    def open(self):
+        '''
+        Opens the master connection. Returns True on success.
+        '''
+
+        if self.isOpen():
+            return True
+
+        self.controlDir = tempfile.mkdtemp(prefix="ssh-")
+        self.controlPath = os.path.join(self.controlDir, "%r@%h:%p")
+
+        cmd = ["ssh", "-M", "-N", "-f", "-o", "ControlPath=%s" % self.controlPath, "-o", "ControlPersist=%d" % self.persist, self.destination()]
+        # the backgrounded master inherits the output streams: pipes would be
+        # kept open by some OpenSSH versions until ControlPersist expires
+        ret = self.transport.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if ret.returncode != 0:
+            print ("Could not open a persistent connection to %s. Using individual connections." % self.host)
+            self._removeControlDir()
+            return False
+
+        return True
+
+    def isOpen(self):
+
+        if not self.controlPath:
+            return False
+
+        ret = self.transport.run(["ssh", "-O", "check"] + self.options() + [self.destination()], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return ret.returncode == 0
+
+    def close(self):
+
+        if self.controlPath:
+            self.transport.run(["ssh", "-O", "exit"] + self.options() + [self.destination()], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self._removeControlDir()
+
+    def run(self, command):
+        '''
+        Executes the command on the remote host and waits for it to finish.
+        Returns the CompletedProcess with the captured stdout and stderr.
+        '''
+
+        return self.transport.run(["ssh"] + self.options() + [self.destination(), command], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def popen(self, command, **kwargs):
+        '''
+        Starts the command on the remote host without waiting for it.
+        Returns the Popen object.
+        '''
+
+        return self.transport.Popen(["ssh"] + self.options() + [self.destination(), command], **kwargs)
+
+    def copyFrom(self, remotePath, localPath):
+        '''
+        Copies a file from the remote host. Returns True on success.
+        '''
+
+        ret = self.transport.run(["scp", "-q"] + self.options() + ["%s:%s" % (self.destination(), remotePath), localPath])
+        return ret.returncode == 0
+
+    def _removeControlDir(self):
+
+        if self.controlDir:
+            shutil.rmtree(self.controlDir, ignore_errors=True)
+        self.controlDir = None
+        self.controlPath = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -21,11 +21,16 @@
 import subprocess 
 import sys
 import os
-import xml.etree.ElementTree as ET
-from datetime import datetime, timedelta
-from time import sleep
+import threading
+import sqlite3
 from optparse import OptionParser
-import matplotlib.pyplot as plt
+
+from mk6fuse import FuseMount
+from qaQueue import QAQueue
+from scanScheduler import buildScheduler, upcoming
+from schedule import readSchedule
+from qaStore import QAStore
+import gmvaDashboard
 
 fuseDir = "/mnt/diskpack/temp"
 rootDir = "/home/oper/GMVA"
@@ -42,8 +47,9 @@ def usage():
 	usage += "In the scan gaps the following additional tasks are being performed:\n"
 	usage += "1) 2-bit sampling statistics are obtained from the previous recording.\n"
 	usage += "2) m5spec is called to obtain bandpasses for all 16 pfb channels\n"
-	usage += "3) The bit statistics and bandpasses from the last scan are displayed graphically\n\n"
-	usage += "The results are stored in text form under %s\n\n" % (rootDir)
+	usage += "3) The bit statistics and bandpasses from the last scan are displayed graphically (gmvaDashboard.py)\n\n"
+	usage += "The results are stored in text form under %s\n" % (rootDir)
+	usage += "and the per-channel summaries in the QA database (see qaStore.py)\n\n"
 	
 
 	return(usage)
@@ -58,11 +64,100 @@ def validate():
 		if not os.path.isfile(script.strip()):
 			sys.exit ("Required file does not exist: %s" % script)
 
-def mountFuse():
-	os.system("fuseMk6 -r '/mnt/disks/%d/*/data' %s" % (options.slot,fuseDir))
+def runM5spec(scanIdx, scanTime, vdifFile, m5specFile):
+	# a scan recorded after the mount is read from a local copy
+	path = fuse.acquire(vdifFile)
+	try:
+		os.system("m5spec %s VDIF_5000-2048-16-2 512 1024 %s" %(path,m5specFile))
+	finally:
+		fuse.release(path)
+
+	# read m5spec output and plot
+	storeResult("m5spec", scanTime, m5specFile)
+	showPlot("m5spec", scanIdx, m5specFile)
 
-def umountFuse():
-	os.system("fusermount -u %s" % fuseDir)
+def runM5bstate(scanIdx, scanTime, vdifFile, m5bstateFile):
+	path = fuse.acquire(vdifFile)
+	try:
+		os.system("m5bstate %s VDIF_5000-2048-16-2 100 >  %s" %(path,m5bstateFile))
+	finally:
+		fuse.release(path)
+
+	# read m5bstate output and plot
+	storeResult("m5bstate", scanTime, m5bstateFile)
+	showPlot("m5bstate", scanIdx, m5bstateFile)
+
+def runQuicklook(scanIdx, scanTime, vdifFile, m5specFile, m5bstateFile):
+	# spectra and state counts in a single pass over the data
+	path = fuse.acquire(vdifFile)
+	try:
+		os.system("m5quicklook.py %s VDIF_5000-2048-16-2 512 1024 %s %s" %(path,m5specFile,m5bstateFile))
+	finally:
+		fuse.release(path)
+
+	storeResult("m5spec", scanTime, m5specFile)
+	storeResult("m5bstate", scanTime, m5bstateFile)
+	showPlot("m5spec", scanIdx, m5specFile)
+	showPlot("m5bstate", scanIdx, m5bstateFile)
+
+def postScan(scanIdx, scan):
+	# executed postScanMargin seconds after the end of each scan
+	station = str(scan['station'])
+	scanName = str(scan['scan'])
+	exp = str(scan['experiment'])
+	scanTime = float(scan['start'])
+
+	# create output directory if it doesn't exist
+	expDir = rootDir + "/" + exp
+	if not os.path.exists(expDir):
+		os.mkdir(expDir)
+
+	recFilename = "%s_%s_%s" %(exp,station,scanName)
+	print (recFilename)
+	print (station, scanName, exp)
+
+	vdifFile = "%s/%s.vdif" % (fuseDir,recFilename)
+
+	# run m5spec and m5bstate on the previous scan
+	m5specFile = "%s/%s.m5spec" % (expDir, recFilename)
+	m5bstateFile = "%s/%s.m5bstate" % (expDir, recFilename)
+
+	if options.singlePass:
+		qa.submit("m5quicklook %s" % recFilename, runQuicklook, scanIdx, scanTime, vdifFile, m5specFile, m5bstateFile)
+	else:
+		qa.submit("m5spec %s" % recFilename, runM5spec, scanIdx, scanTime, vdifFile, m5specFile)
+		qa.submit("m5bstate %s" % recFilename, runM5bstate, scanIdx, scanTime, vdifFile, m5bstateFile)
+
+	showUpcoming(scheduler)
+
+def showUpcoming(scheduler, count=1):
+	events = upcoming(scheduler)
+	print ("%d scans remaining" % len(events))
+	for when, scanName in events[:count]:
+		print ("next: %s at %s" % (scanName, when))
+
+def storeResult(kind, scanTime, path):
+	# add the per-channel summary of the result file to the QA database
+	try:
+		if kind == "m5spec":
+			store.ingestM5spec(path, scanTime)
+		else:
+			store.ingestM5bstate(path, scanTime)
+	except (OSError, ValueError, sqlite3.Error) as e:
+		print ("Could not store %s in the QA database (%s)" % (path, e))
+
+def showPlot(kind, scanIdx, path):
+	'''
+	Sends the result of the given kind (m5spec or m5bstate) of scan number
+	scanIdx to the dashboard unless the result of a later scan is already
+	displayed.
+	'''
+	with plotLock:
+		if lastPlotted.get(kind, -1) > scanIdx:
+			return
+		lastPlotted[kind] = scanIdx
+		if not gmvaDashboard.notify(dashboard.stdin, kind, path):
+			print ("The dashboard is not running. Cannot display %s" % path)
 
 
 
@@ -72,6 +167,10 @@ parser = OptionParser(usage=usage(),version=version)
 parser.add_option("--postScanMargin", type="int", default=20, dest="postScanMargin", help="number of seconds after the end of the next scan in which no further commands will be executed (default=20)")
 parser.add_option("-s", "--slot", type="int", default=1, help="The recorder slot used for recording (default: 1)")
 parser.add_option("-m", "--monitor-only", action="store_true", dest="monitor", help="Do not start the schedule. Only monitor between the recordings")
+parser.add_option("--qa-workers", type="int", default=2, dest="qaWorkers", help="maximum number of QA tasks (m5spec, m5bstate) running in parallel (default=2)")
+parser.add_option("--qa-backlog", type="int", default=4, dest="qaBacklog", help="maximum number of waiting QA tasks. If exceeded the oldest task is dropped (default=4)")
+parser.add_option("-1", "--single-pass", action="store_true", dest="singlePass", help="obtain the bandpasses and the sampling statistics in a single read of the data with m5quicklook.py instead of m5spec and m5bstate")
+parser.add_option("--qa-db", default=rootDir + "/gmva_qa.sqlite", dest="qaDb", help="the QA database receiving the per-channel results of every scan (default=%s/gmva_qa.sqlite)" % rootDir)
 parser.add_option("-3", "--dbbc3", action="store_true", dest="dbbc3", help="use a DBBC3 backend")
 
 
@@ -93,7 +192,8 @@ if not os.path.exists(fuseDir):
 	os.mkdir(fuseDir)
 
 # make sure that there are no remaining fuse mounts
-umountFuse()
+fuse = FuseMount(options.slot, fuseDir)
+fuse.umount()
 
 # create output root directory
 if not os.path.exists(rootDir):
@@ -104,69 +204,27 @@ if not options.monitor:
 	schedArgs = "%s -f %s" % (m6ccCommand, schedule)
 	m6cc = subprocess.Popen(["xterm", "-e", schedArgs], stderr=subprocess.STDOUT)
 
-tree = ET.parse(schedule)
-root = tree.getroot()
-
-pM5spec = None
-pM5bstate = None
-
-for scan in root.findall("scan"):
+# the scans sorted by start time, with the times converted once
+scans = readSchedule(schedule)
 
-	duration = int(scan.get('duration'))
-	station = scan.get('station_code')
-	scanName = scan.get('scan_name')
-	exp = scan.get('experiment')
+# post-scan QA is done in the background so that it never delays the schedule
+qa = QAQueue(options.qaWorkers, options.qaBacklog)
+store = QAStore(options.qaDb)
+lastPlotted = {}
+plotLock = threading.Lock()
 
-	# create output directory if it doesn't exist
-	expDir = rootDir + "/" + exp
-	if not os.path.exists(expDir):
-        	os.mkdir(expDir)
-
-
-	recFilename = "%s_%s_%s" %(exp,station,scanName)
-	print recFilename
-
-	dtStart = datetime.strptime(scan.get('start_time'), '%Y%j%H%M%S')
-	dtStop = dtStart + timedelta(seconds=duration)
-	dtNow = datetime.utcnow()
+# the dashboard displays the results of the last scan; they are announced on its stdin
+dashboard = subprocess.Popen(["gmvaDashboard.py"], stdin=subprocess.PIPE, universal_newlines=True)
 
-	print station, scanName, exp
+# run the QA after every scan
+scheduler = buildScheduler(scans, postScanMargin, postScan)
+showUpcoming(scheduler)
+scheduler.run()
 
-	# running m5spec on the last
-	
-	if dtStop < dtNow:
-		print "Scan %s lies in the past. Skipping" % scan.get('scan_name')
-		continue
-
-	# sleep until scan has finished
-	deltaStop = dtStop  + timedelta(seconds=postScanMargin) - datetime.utcnow()
-	print "sleeping until: ", datetime.utcnow() + deltaStop
-	sleep(float(deltaStop.seconds))
-
-	# if there are any plots from the previous scan close them now
-	if pM5spec:
-		pM5spec.terminate()
-	if pM5bstate:
-		pM5bstate.terminate()
-
-	# fuse mount the module
-	mountFuse()
-	
-	vdifFile = "%s/%s.vdif" % (fuseDir,recFilename)
-
-	# run m5spec on the previous scan
-	m5specFile = "%s/%s.m5spec" % (expDir, recFilename)
-
-	os.system("m5spec %s VDIF_5000-2048-16-2 512 1024 %s" %(vdifFile,m5specFile))
-
-	# read m5spec output and plot
-	pM5spec = subprocess.Popen(["plot_pfb_m5spec.py", m5specFile], stdout=subprocess.PIPE)	
-
-	# run m5bstate on the previous scan
-	m5bstateFile = "%s/%s.m5bstate" % (expDir, recFilename)
-	os.system("m5bstate %s VDIF_5000-2048-16-2 100 >  %s" %(vdifFile,m5bstateFile))
-
-	# read m5bstate output and plot
-	pM5bstate = subprocess.Popen(["plot_m5bstate.py", m5bstateFile], stdout=subprocess.PIPE)	
+# wait for the QA of the last scans
+qa.shutdown(wait=True)
+store.close()
+dashboard.stdin.close()
 
-	umountFuse()
+fuse.close()
+print ("fuse mount statistics: %s" % fuse.metrics())
@@ -0,0 +1,54 @@
+###########################################################################
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+'''
+Tests of the result announcements sent to the dashboard.
+'''
+
+import io
+
+import pytest
+
+from gmvaDashboard import notify, parseMessage
+
+
+def test_notifyRoundTrip():
+
+    stream = io.StringIO()
+
+    assert notify(stream, "m5spec", "/data/e22 scan.m5spec")
+    assert notify(stream, "m5bstate", "/data/scan.m5bstate")
+
+    lines = stream.getvalue().splitlines()
+    assert [parseMessage(line) for line in lines] == [("m5spec", "/data/e22 scan.m5spec"), ("m5bstate", "/data/scan.m5bstate")]
+
+def test_notifyClosedStream():
+
+    stream = io.StringIO()
+    stream.close()
+
+    assert not notify(stream, "m5spec", "scan.m5spec")
+
+@pytest.mark.parametrize("line", [
+    "not json",
+    "[\"m5spec\", \"scan.m5spec\"]",
+    "{\"kind\": \"rm\", \"path\": \"scan.m5spec\"}",
+    "{\"kind\": \"m5spec\", \"path\": 1}",
+    "{\"kind\": \"m5spec\"}",
+])
+def test_parseMessageInvalid(line):
+
+    with pytest.raises(ValueError):
+        parseMessage(line)
@@ -0,0 +1,59 @@
+###########################################################################
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+'''
+Tests of the m5spec reader and its cache.
+'''
+
+import os
+import numpy as np
+
+from m5data import readM5spec, writeM5spec
+
+
+def cacheFiles(directory):
+
+    return sorted(name for name in os.listdir(directory) if name.endswith(".npy"))
+
+def test_cacheIsReused(tmp_path):
+
+    path = str(tmp_path / "a.m5spec")
+    writeM5spec(path, np.arange(4.0), np.ones((4, 2)))
+
+    first = readM5spec(path)
+    assert len(cacheFiles(tmp_path)) == 1
+    assert np.array_equal(readM5spec(path), first)
+    assert len(cacheFiles(tmp_path)) == 1
+
+def test_staleCachesOfOtherFilesAreKept(tmp_path):
+
+    path = str(tmp_path / "foo.m5spec")
+    backup = str(tmp_path / "foo.m5spec.bak")
+    writeM5spec(path, np.arange(4.0), np.ones((4, 2)))
+    writeM5spec(backup, np.arange(4.0), np.zeros((4, 2)))
+
+    readM5spec(backup)
+    backupCache = cacheFiles(tmp_path)
+    readM5spec(path)
+    assert len(cacheFiles(tmp_path)) == 2
+
+    # a new version of foo.m5spec replaces its own cache only
+    writeM5spec(path, np.arange(5.0), np.ones((5, 2)))
+    os.utime(path, ns=(1, 1))
+    assert readM5spec(path).shape == (5, 3)
+
+    caches = cacheFiles(tmp_path)
+    assert len(caches) == 2
+    assert backupCache[0] in caches
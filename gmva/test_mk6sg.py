@@ -0,0 +1,136 @@
+###########################################################################
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+'''
+Tests of the scatter-gather reader and of the scans read by FuseMount
+without a mount, on synthetic modules.
+'''
+
+import os
+import threading
+
+import pytest
+
+import mk6sg
+from mk6fuse import FuseMount
+
+
+def writeModule(root, slot, scanName, stream, numDisks=3, blockBytes=100, version=2):
+    '''
+    Distributes stream over numDisks scatter-gather files of blockBytes
+    data per block, round robin as the recorder does. The files are written
+    in reverse block order to check the sorting.
+    '''
+
+    blocks = [stream[i:i + blockBytes] for i in range(0, len(stream), blockBytes)]
+    blockHeader = mk6sg.blockHeaders[version]
+
+    for disk in range(numDisks):
+        directory = os.path.join(str(root), str(slot), str(disk), "data")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, scanName), "wb") as f:
+            f.write(mk6sg.fileHeader.pack(mk6sg.syncWord, version, blockBytes + blockHeader.size, 2, 20))
+            for number in reversed(range(disk, len(blocks), numDisks)):
+                fields = (number, len(blocks[number]) + blockHeader.size) if version == 2 else (number,)
+                f.write(blockHeader.pack(*fields) + blocks[number])
+
+@pytest.fixture
+def stream():
+
+    return bytes(range(256)) * 8
+
+@pytest.mark.parametrize("version", [1, 2])
+def test_gatherRestoresStream(tmp_path, stream, version):
+
+    # version 1 has no block sizes: the stream is a multiple of the block size
+    writeModule(tmp_path, 1, "e22_Pv_no0001", stream[:2000], version=version)
+    files = mk6sg.scanFiles(1, "e22_Pv_no0001", str(tmp_path))
+    outPath = str(tmp_path / "out.vdif")
+
+    assert len(files) == 3
+    assert mk6sg.gather(files, outPath) == 2000
+    with open(outPath, "rb") as f:
+        assert f.read() == stream[:2000]
+
+def test_gatherWholePackets(tmp_path, stream):
+
+    writeModule(tmp_path, 1, "scan", stream)
+    outPath = str(tmp_path / "out.vdif")
+
+    # packet size 20: 555 bytes are rounded down to 540
+    assert mk6sg.gather(mk6sg.scanFiles(1, "scan", str(tmp_path)), outPath, 555) == 540
+    with open(outPath, "rb") as f:
+        assert f.read() == stream[:540]
+
+def test_readBlockListIncompleteBlock(tmp_path, stream):
+
+    writeModule(tmp_path, 1, "scan", stream[:600], numDisks=1)
+    path = mk6sg.scanFiles(1, "scan", str(tmp_path))[0]
+    with open(path, "ab") as f:
+        f.write(mk6sg.blockHeaders[2].pack(6, 108) + b"\0" * 30)
+
+    header, blocks = mk6sg.readBlockList(path)
+
+    assert header['version'] == 2 and header['packetSize'] == 20
+    assert sorted(blocks)[-1][0] == 6 and sorted(blocks)[-1][2] == 30
+
+def test_notScatterGather(tmp_path):
+
+    path = tmp_path / "scan"
+    path.write_bytes(b"\0" * 100)
+
+    with pytest.raises(ValueError):
+        mk6sg.readBlockList(str(path))
+
+def test_fuseMountReadsNewScansDirectly(tmp_path, stream, monkeypatch):
+
+    writeModule(tmp_path / "disks", 2, "No0001.vdif", stream)
+    mountPoint = tmp_path / "mnt"
+    mountPoint.mkdir()
+
+    fuse = FuseMount(2, str(mountPoint), spoolDir=str(tmp_path / "spool"), gatherBytes=1000, keepGathered=1, diskRoot=str(tmp_path / "disks"))
+    (tmp_path / "spool").mkdir()
+    # no fuseMk6 here: the scans are only readable from the scatter-gather files
+    monkeypatch.setattr(fuse, "mount", lambda: False)
+    monkeypatch.setattr(fuse, "umount", lambda: None)
+
+    paths = []
+    threads = [threading.Thread(target=lambda: paths.append(fuse.acquire(str(mountPoint / "No0001.vdif")))) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # the concurrent readers share one gathered file
+    assert len(set(paths)) == 1
+    assert fuse.metrics()['gathered'] == 1
+    with open(paths[0], "rb") as f:
+        assert f.read() == stream[:1000]
+
+    # a scan that is not on the module is passed on unchanged
+    missing = str(mountPoint / "No0002.vdif")
+    assert fuse.acquire(missing) == missing
+    fuse.release(missing)
+
+    # the gathered file is removed once unused and no longer among the last scans
+    writeModule(tmp_path / "disks", 2, "No0003.vdif", stream)
+    newer = fuse.acquire(str(mountPoint / "No0003.vdif"))
+    for path in paths:
+        fuse.release(path)
+    assert not os.path.exists(paths[0])
+
+    fuse.release(newer)
+    fuse.close()
+    assert not os.path.exists(newer)
@@ -0,0 +1,123 @@
+###########################################################################
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+'''
+Timing tests of the scan gap scheduler on a simulated clock.
+'''
+
+import numpy as np
+
+from scanScheduler import SimulatedClock, buildScheduler, upcoming
+from schedule import scheduleDtype
+
+
+def makeSchedule(scans):
+    '''
+    Returns a schedule array for a list of (start, duration) tuples.
+    '''
+
+    schedule = np.zeros(len(scans), dtype=scheduleDtype())
+    for i, (start, duration) in enumerate(scans):
+        schedule[i] = (start, duration, "No%04d" % (i + 1), "t001", "Pv")
+
+    return schedule
+
+class Recorder:
+    '''
+    The scheduler action: records the scan name and the clock time of every
+    call. Optionally lets the clock advance to simulate a slow action.
+    '''
+
+    def __init__(self, clock, delay=0.0):
+
+        self.clock = clock
+        self.delay = delay
+        self.calls = []
+
+    def __call__(self, scanIdx, scan):
+
+        self.calls.append((str(scan['scan']), self.clock.time()))
+        self.clock.sleep(self.delay)
+
+def run(schedule, now, margin=20, delay=0.0):
+
+    clock = SimulatedClock(now)
+    action = Recorder(clock, delay)
+    scheduler = buildScheduler(schedule, margin, action, clock.time, clock.sleep)
+    scheduler.run()
+
+    return action.calls
+
+def test_eventsAtScanEndPlusMargin():
+
+    schedule = makeSchedule([(1000, 60), (1100, 60), (1200, 60)])
+
+    assert run(schedule, 0, margin=20) == [("No0001", 1080), ("No0002", 1180), ("No0003", 1280)]
+
+def test_lateStartSkipsPastScans(capsys):
+
+    schedule = makeSchedule([(1000 + 100 * i, 60) for i in range(10)])
+
+    # scans 1 to 4 have ended, scan 5 (1400-1460) is running
+    calls = run(schedule, 1430, margin=20)
+
+    assert [name for name, t in calls] == ["No%04d" % i for i in range(5, 11)]
+    assert calls[0] == ("No0005", 1480)
+    assert "4 scans lie in the past" in capsys.readouterr().out
+
+def test_lateStartWithinMargin():
+
+    # the scan has ended but its post scan margin has not passed
+    schedule = makeSchedule([(1000, 60), (1100, 60)])
+
+    assert run(schedule, 1070, margin=20) == [("No0002", 1180)]
+
+def test_overdueEventsRunInOrder():
+
+    schedule = makeSchedule([(1000, 60), (1100, 60), (1200, 60), (1300, 60)])
+
+    # every action takes 250 s: the following events become overdue
+    calls = run(schedule, 0, margin=20, delay=250)
+
+    assert [name for name, t in calls] == ["No0001", "No0002", "No0003", "No0004"]
+    # an overdue event is executed as soon as the previous action returns
+    assert [t for name, t in calls] == [1080, 1330, 1580, 1830]
+
+def test_overlappingScansOrderedByStop():
+
+    # scan 1 overlaps the shorter scans 2 and 3 that end before it
+    schedule = makeSchedule([(1000, 300), (1010, 20), (1050, 20), (1400, 60)])
+
+    calls = run(schedule, 0, margin=0)
+
+    assert calls == [("No0002", 1030), ("No0003", 1070), ("No0001", 1300), ("No0004", 1460)]
+
+def test_overlappedScansThatEndedAreSkipped():
+
+    schedule = makeSchedule([(1000, 300), (1010, 20), (1050, 20), (1400, 60)])
+
+    # scan 1 is still running, the overlapped scan 2 has ended
+    calls = run(schedule, 1040, margin=0)
+
+    assert calls == [("No0003", 1070), ("No0001", 1300), ("No0004", 1460)]
+
+def test_equalStopTimesKeepScheduleOrder():
+
+    schedule = makeSchedule([(1000, 100), (1050, 50), (1080, 20)])
+
+    clock = SimulatedClock(0)
+    scheduler = buildScheduler(schedule, 0, Recorder(clock), clock.time, clock.sleep)
+
+    assert [name for t, name in upcoming(scheduler)] == ["No0001", "No0002", "No0003"]
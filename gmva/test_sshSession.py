@@ -0,0 +1,142 @@
+###########################################################################
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+'''
+Tests of SshSession with a fake transport: no ssh process is started, the
+commands are only recorded.
+'''
+
+import os
+import subprocess
+
+from sshSession import SshSession
+
+
+class FakeTransport:
+    '''
+    Records the commands and keyword arguments of run() and Popen(). The
+    return code of a command is looked up by its first arguments in
+    returnCodes (default 0).
+    '''
+
+    def __init__(self, returnCodes=None):
+
+        self.calls = []
+        self.returnCodes = returnCodes or {}
+
+    def _returnCode(self, cmd):
+
+        for prefix, code in self.returnCodes.items():
+            if tuple(cmd[:len(prefix)]) == prefix:
+                return code
+        return 0
+
+    def run(self, cmd, **kwargs):
+
+        self.calls.append((cmd, kwargs))
+        return subprocess.CompletedProcess(cmd, self._returnCode(cmd), b"", b"")
+
+    def Popen(self, cmd, **kwargs):
+
+        self.calls.append((cmd, kwargs))
+        return subprocess.CompletedProcess(cmd, self._returnCode(cmd))
+
+
+def controlPath(cmd):
+
+    paths = [arg.split("=", 1)[1] for arg in cmd if arg.startswith("ControlPath=")]
+    assert len(paths) == 1
+    return paths[0]
+
+def test_open():
+
+    transport = FakeTransport()
+    session = SshSession("recorder1", user="oper", persist=300, transport=transport)
+
+    assert session.open()
+
+    cmd, kwargs = transport.calls[-1]
+    assert cmd[:4] == ["ssh", "-M", "-N", "-f"]
+    assert "ControlPersist=300" in cmd
+    assert cmd[-1] == "oper@recorder1"
+    assert controlPath(cmd) == session.controlPath
+    assert os.path.isdir(session.controlDir)
+    # the backgrounded master must not hold on to a pipe
+    assert kwargs["stdout"] == subprocess.DEVNULL
+    assert kwargs["stderr"] == subprocess.DEVNULL
+
+    session.close()
+
+def test_runAndCopyShareTheMaster():
+
+    transport = FakeTransport()
+    session = SshSession("recorder1", user="oper", transport=transport)
+    session.open()
+
+    session.run("ls /mnt/disks")
+    cmd, kwargs = transport.calls[-1]
+    assert cmd == ["ssh", "-o", "ControlMaster=no", "-o", "ControlPath=%s" % session.controlPath, "oper@recorder1", "ls /mnt/disks"]
+    assert kwargs["stdout"] == subprocess.PIPE
+
+    session.popen("m5spec -", stdout=subprocess.PIPE)
+    cmd, kwargs = transport.calls[-1]
+    assert cmd[0] == "ssh" and controlPath(cmd) == session.controlPath
+    assert cmd[-2:] == ["oper@recorder1", "m5spec -"]
+    assert kwargs == {"stdout": subprocess.PIPE}
+
+    assert session.copyFrom("/tmp/pol0.m5spec", "/tmp/local.m5spec")
+    cmd, kwargs = transport.calls[-1]
+    assert cmd[:2] == ["scp", "-q"]
+    assert controlPath(cmd) == session.controlPath
+    assert cmd[-2:] == ["oper@recorder1:/tmp/pol0.m5spec", "/tmp/local.m5spec"]
+
+    session.close()
+
+def test_close():
+
+    transport = FakeTransport()
+    session = SshSession("recorder1", transport=transport)
+    session.open()
+    path = session.controlPath
+    controlDir = session.controlDir
+
+    session.close()
+
+    cmd, kwargs = transport.calls[-1]
+    assert cmd[:3] == ["ssh", "-O", "exit"]
+    assert controlPath(cmd) == path
+    assert cmd[-1] == "recorder1"
+    assert session.controlPath is None
+    assert not os.path.exists(controlDir)
+
+def test_fallbackWhenOpenFails():
+
+    transport = FakeTransport({("ssh", "-M"): 255})
+    session = SshSession("recorder1", user="oper", transport=transport)
+
+    assert not session.open()
+    assert session.controlPath is None
+    assert session.controlDir is None
+
+    # individual connections without the control options
+    session.run("ls")
+    assert transport.calls[-1][0] == ["ssh", "oper@recorder1", "ls"]
+    session.copyFrom("/tmp/a", "/tmp/b")
+    assert transport.calls[-1][0] == ["scp", "-q", "oper@recorder1:/tmp/a", "/tmp/b"]
+
+    # nothing to shut down
+    calls = len(transport.calls)
+    session.close()
+    assert len(transport.calls) == calls
@@ -0,0 +1,101 @@
+###########################################################################
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+'''
+Tests of the tone finder. The vectorized finder is checked against the
+per-sample loop it replaced.
+'''
+
+import numpy as np
+import pytest
+
+from toneDetect import findPeaks, robustZScores
+
+
+def loopFindPeaks(y, z_threshold=4.5, minDist=1):
+    '''
+    The per-sample tone finder of getM5specTone before it was vectorized.
+    '''
+
+    peaks = []
+
+    # calculate the z-scores
+    mean_y = np.mean(y)
+    std_y = np.std(y)
+    z_scores = (y - mean_y) / std_y
+
+    lastPeakPos = -minDist - 1
+
+    for i in range(1, len(y)-1):
+        if z_scores[i] >= z_threshold:                  # Z-score above threshold?
+            if y[i] > y[i-1] and y[i] > y[i+1]:          # local minimum
+                if i - lastPeakPos > minDist:
+                    peaks.append(i)
+                    lastPeakPos = i
+
+    return(peaks)
+
+def randomSpectra(rng, points, bands, tones):
+
+    spectra = rng.normal(10.0, 1.0, (points, bands))
+    for band in range(bands):
+        pos = rng.integers(1, points - 1, tones)
+        spectra[pos, band] += rng.uniform(3.0, 20.0, tones)
+        # clusters of neighbouring tones exercise the minimum distance
+        spectra[np.minimum(pos + 2, points - 1), band] += rng.uniform(3.0, 20.0, tones)
+
+    return spectra
+
+@pytest.mark.parametrize("minDist", [1, 2, 5])
+@pytest.mark.parametrize("zThreshold", [2.0, 4.5])
+def test_findPeaksMatchesLoop(minDist, zThreshold):
+
+    rng = np.random.default_rng(minDist)
+    spectra = randomSpectra(rng, 512, 400, 6)
+
+    peaks = findPeaks(spectra, zThreshold, minDist)
+
+    assert len(peaks) == spectra.shape[1]
+    for band in range(spectra.shape[1]):
+        assert list(peaks[band]) == loopFindPeaks(spectra[:, band], zThreshold, minDist)
+
+def test_findPeaksSingleBand():
+
+    y = np.ones(64)
+    y[20] = 50.0
+
+    peaks = findPeaks(y)
+
+    assert len(peaks) == 1
+    assert list(peaks[0]) == loopFindPeaks(y) == [20]
+
+def test_findPeaksEdgesNotReported():
+
+    y = np.ones(64)
+    y[0] = y[-1] = 50.0
+
+    assert list(findPeaks(y)[0]) == []
+
+def test_robustZScoresZeroMad():
+
+    spectra = np.full((256, 2), 5.0)
+    spectra[100, 0] = 50.0
+
+    with np.errstate(all="raise"):
+        z = robustZScores(spectra)
+
+    assert np.isfinite(z).all()
+    assert (z[:, 1] == 0).all()
+    assert [list(p) for p in findPeaks(spectra, baseline="median")] == [[100], []]
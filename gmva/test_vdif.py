@@ -0,0 +1,160 @@
+###########################################################################
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+'''
+Tests of the VDIF reader and the 2-bit unpacking on synthetic files.
+'''
+
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import vdif
+
+
+@pytest.fixture
+def twoThreads(tmp_path):
+    '''
+    A file with 2 interleaved threads, 16 frames per thread at 4 frames
+    per second starting at second 10 of epoch 40 (2020-01-01).
+    '''
+
+    path = str(tmp_path / "test.vdif")
+    codes = vdif.writeSynthetic(path, 32, payloadBytes=1024, numChannels=16, threads=2, second=10, epoch=40, framesPerSecond=4)
+
+    return (path, codes)
+
+def test_header(twoThreads):
+
+    path, codes = twoThreads
+    f = vdif.VdifFile(path)
+
+    assert f.frameBytes == 1024 + vdif.headerBytes
+    assert f.headerBytes == vdif.headerBytes
+    assert f.numChannels == 16
+    assert f.bitsPerSample == 2
+    assert f.numFrames == 32
+
+def test_index(twoThreads):
+
+    path, codes = twoThreads
+    index = vdif.VdifFile(path).index
+
+    assert list(index['offset'][:3]) == [0, 1056, 2112]
+    assert list(index['thread'][:4]) == [0, 1, 0, 1]
+    # frames of both threads carry the same time stamp
+    frameNum = np.repeat(np.arange(16), 2)
+    assert (index['second'] == 10 + frameNum // 4).all()
+    assert (index['frame'] == frameNum % 4).all()
+    assert (index['epoch'] == 40).all()
+    assert index['valid'].all()
+
+def test_threadsAndTime(twoThreads):
+
+    path, codes = twoThreads
+    f = vdif.VdifFile(path)
+
+    assert list(f.threads()) == [0, 1]
+    assert f.framesPerSecond() == 4
+    assert f.time(0) == datetime(2020, 1, 1, 0, 0, 10)
+    # frame 2 of second 11 (thread 1)
+    assert f.time(13) == datetime(2020, 1, 1, 0, 0, 11, 500000)
+
+def test_findFrame(twoThreads):
+
+    path, codes = twoThreads
+    f = vdif.VdifFile(path)
+
+    assert f.findFrame(10) == 0
+    # the first thread of frame 1 of second 12
+    assert f.findFrame(12, 1) == 18
+    assert f.index['second'][18] == 12 and f.index['frame'][18] == 1
+    # before the start and after the end of the file
+    assert f.findFrame(5) == 0
+    assert f.findFrame(20) == 32
+
+def test_payloadsZeroCopy(twoThreads):
+
+    path, codes = twoThreads
+    f = vdif.VdifFile(path)
+
+    payloads = f.payloads(4, 8)
+
+    assert payloads.shape == (8, 1024)
+    assert np.shares_memory(payloads, f.data)
+    assert not payloads.flags.writeable
+
+def test_payloadsThreadSelection(twoThreads):
+
+    path, codes = twoThreads
+    f = vdif.VdifFile(path)
+
+    for thread in (0, 1):
+        payloads = f.payloads(thread=thread)
+        assert payloads.shape == (16, 1024)
+        assert not np.shares_memory(payloads, f.data)
+        assert np.array_equal(vdif.unpack2bit(payloads, 16), codes[thread])
+
+def test_payloadsSkipInvalidFrames(twoThreads):
+
+    path, codes = twoThreads
+
+    # flag frame 3 as invalid
+    data = np.memmap(path, dtype=np.uint8, mode="r+")
+    header = data[3 * 1056:3 * 1056 + 4].view("<u4")
+    header[0] |= np.uint32(1 << 31)
+    data.flush()
+    del data
+
+    f = vdif.VdifFile(path)
+    payloads = f.payloads(0, 6)
+
+    assert not f.index['valid'][3]
+    assert payloads.shape == (5, 1024)
+    assert np.array_equal(payloads[3], f.frames[4, f.headerBytes:])
+
+def test_unpack2bitKnownCodes():
+
+    # 0xe4 = 11 10 01 00: the first sample is in the least significant bits
+    payload = np.array([0xe4, 0x1b], dtype=np.uint8)
+
+    assert vdif.unpack2bit(payload, 1).ravel().tolist() == [0, 1, 2, 3, 3, 2, 1, 0]
+    assert vdif.unpack2bit(payload, 1, np.int8).ravel().tolist() == [-3, -1, 1, 3, 3, 1, -1, -3]
+    assert np.array_equal(vdif.unpack2bit(payload, 1, np.float32).ravel(), vdif.levels2bit[[0, 1, 2, 3, 3, 2, 1, 0]])
+
+    with pytest.raises(ValueError):
+        vdif.unpack2bit(payload, 1, np.int16)
+
+def test_decode2bitChannels():
+
+    payload = np.array([0xe4, 0x1b], dtype=np.uint8)
+
+    assert vdif.decode2bit(payload, 2, np.uint8).tolist() == [[0, 2, 3, 1], [1, 3, 2, 0]]
+    assert vdif.decode2bit(payload, 4, np.uint8).tolist() == [[0, 3], [1, 2], [2, 1], [3, 0]]
+
+    decoded = vdif.decode2bit(payload, 2)
+    assert decoded.dtype == np.float32
+    assert decoded.flags.c_contiguous
+
+    with pytest.raises(ValueError):
+        vdif.decode2bit(payload, 3)
+
+def test_decode2bitSynthetic(twoThreads):
+
+    path, codes = twoThreads
+    payloads = vdif.VdifFile(path).payloads(thread=1)
+
+    assert np.array_equal(vdif.decode2bit(payloads, 16, np.uint8), codes[1].T)
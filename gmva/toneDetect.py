@@ -0,0 +1,207 @@
+###########################################################################
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+'''
+Vectorized detection of injected tones in m5spec spectra.
+
+All functions operate on a 2-D array of shape (points, bands) so that all
+bands of a spectrum are processed in one call. 1-D arrays are treated as a
+single band.
+'''
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+baselineModes = ("global", "median")
+fitModes = ("parabolic", "gaussian")
+
+# scale factor converting the MAD into the standard deviation of gaussian noise
+madToStd = 1.4826
+
+
+def zScores(spectra):
+    '''
+    Returns the z-scores of the spectra using the global mean and standard
+    deviation of each band.
+    '''
+
+    spectra = np.asarray(spectra, dtype=float)
+    mean = spectra.mean(axis=0)
+    std = spectra.std(axis=0)
+
+    return (spectra - mean) / std
+
+def robustZScores(spectra, window=64):
+    '''
+    Returns the z-scores of the spectra relative to a running median with
+    the scale estimated from the running median absolute deviation (MAD)
+    over window points.
+
+    The window statistics are evaluated on a grid with a spacing of 1/8 of
+    the window and linearly interpolated in between, which keeps the cost
+    linear in the number of points. Bandpass slopes and isolated RFI
+    spikes therefore do not inflate the noise estimate of the whole band.
+    Windows with a MAD of 0 do not produce infinite z-scores.
+    '''
+
+    spectra = np.asarray(spectra, dtype=float)
+    points = spectra.shape[0]
+    window = max(3, min(int(window), points))
+    step = max(1, window // 8)
+
+    # centre the windows on the grid points by mirroring the band edges
+    half = window // 2
+    padded = np.pad(spectra, [(half, window - half - 1)] + [(0, 0)] * (spectra.ndim - 1), mode="reflect")
+
+    centres = np.arange(0, points, step)
+    if centres[-1] != points - 1:
+        centres = np.append(centres, points - 1)
+
+    windows = sliding_window_view(padded, window, axis=0)[centres]
+    median = np.median(windows, axis=-1)
+    mad = np.median(np.abs(windows - median[..., np.newaxis]), axis=-1)
+
+    # linear interpolation of the grid values onto every point
+    pos = np.arange(points)
+    idx = np.minimum(np.searchsorted(centres, pos, side="right") - 1, len(centres) - 2)
+    idx = np.maximum(idx, 0)
+    if len(centres) > 1:
+        weight = (pos - centres[idx]) / (centres[idx + 1] - centres[idx])
+        weight = weight.reshape((-1,) + (1,) * (spectra.ndim - 1))
+        median = median[idx] + weight * (median[idx + 1] - median[idx])
+        mad = mad[idx] + weight * (mad[idx + 1] - mad[idx])
+
+    # flat stretches (e.g. all-zero channels) have a MAD of 0: use the smallest
+    # positive MAD of the band, or its standard deviation if the MAD is 0
+    # everywhere, as a floor. Points of a constant band get a z-score of 0.
+    scale = madToStd * mad
+    floor = np.min(np.where(scale > 0, scale, np.inf), axis=0)
+    floor = np.where(np.isfinite(floor), floor, spectra.std(axis=0))
+    scale = np.maximum(scale, floor)
+
+    z = np.zeros_like(spectra)
+    np.divide(spectra - median, scale, out=z, where=scale > 0)
+
+    return z
+
+def findPeaks(spectra, zThreshold=4.5, minDist=1, baseline="global", window=64):
+    '''
+    Finds the tones in all bands of the spectra.
+
+    A point is considered a tone if its z-score reaches zThreshold, it is a
+    strict local maximum and it is more than minDist points away from the
+    previously accepted tone of the same band. The first and the last point
+    of a band are never reported.
+
+    baseline selects how the z-scores are calculated: "global" uses the mean
+    and standard deviation of the whole band, "median" uses the running
+    median and MAD over window points (see robustZScores).
+
+    Returns a list with one array of peak indices per band.
+    '''
+
+    spectra = np.asarray(spectra, dtype=float)
+    if spectra.ndim == 1:
+        spectra = spectra[:, np.newaxis]
+
+    if baseline == "median":
+        z = robustZScores(spectra, window)
+    elif baseline == "global":
+        z = zScores(spectra)
+    else:
+        raise ValueError("Unknown baseline mode: %s" % baseline)
+
+    inner = spectra[1:-1]
+    candidates = (z[1:-1] >= zThreshold) & (inner > spectra[:-2]) & (inner > spectra[2:])
+
+    # candidates[i] refers to point i+1 of the band
+    bands, points = np.nonzero(candidates.T)
+    points += 1
+
+    # split the (sorted) candidate list into one array per band
+    split = np.searchsorted(bands, np.arange(1, spectra.shape[1]))
+    peaks = np.split(points, split)
+
+    # two strict local maxima are at least two points apart, so the minimum
+    # distance only needs to be enforced for minDist > 1
+    if minDist > 1:
+        peaks = [_applyMinDist(p, minDist) for p in peaks]
+
+    return peaks
+
+def refinePeaks(spectra, peaks, method="gaussian"):
+    '''
+    Refines the position and amplitude of the peaks found by findPeaks to
+    sub-point precision.
+
+    A parabola is fitted through each peak and its two neighbours (for the
+    "gaussian" method the parabola is fitted to the logarithm of the
+    amplitudes, which is exact for a gaussian shaped tone). All peaks of all
+    bands are fitted in one vectorized pass. Peaks with non-positive
+    amplitudes in the fitted points fall back to the parabolic fit.
+
+    Returns a list with one (offsets, amplitudes) tuple per band, where
+    offsets are the fitted peak positions in points relative to the peak
+    index (between -0.5 and 0.5).
+    '''
+
+    if method not in fitModes:
+        raise ValueError("Unknown fit method: %s" % method)
+
+    spectra = np.asarray(spectra, dtype=float)
+    if spectra.ndim == 1:
+        spectra = spectra[:, np.newaxis]
+
+    counts = [len(p) for p in peaks]
+    points = np.concatenate([np.asarray(p, dtype=int) for p in peaks]) if peaks else np.empty(0, dtype=int)
+    bands = np.repeat(np.arange(len(peaks)), counts)
+
+    a = spectra[points - 1, bands]
+    b = spectra[points, bands]
+    c = spectra[points + 1, bands]
+
+    offset, amp = _fitParabola(a, b, c)
+
+    if method == "gaussian":
+        positive = (a > 0) & (b > 0) & (c > 0)
+        if positive.any():
+            logOffset, logAmp = _fitParabola(np.log(a[positive]), np.log(b[positive]), np.log(c[positive]))
+            offset[positive] = logOffset
+            amp[positive] = np.exp(logAmp)
+
+    split = np.cumsum(counts)[:-1]
+
+    return list(zip(np.split(offset, split), np.split(amp, split)))
+
+def _fitParabola(a, b, c):
+
+    # vertex of the parabola through (-1, a), (0, b), (1, c)
+    denom = a - 2 * b + c
+    offset = np.zeros_like(b)
+    np.divide(0.5 * (a - c), denom, out=offset, where=denom != 0)
+    amp = b - 0.25 * (a - c) * offset
+
+    return (offset, amp)
+
+def _applyMinDist(peaks, minDist):
+
+    accepted = []
+    lastPeakPos = -minDist - 1
+    for peak in peaks:
+        if peak - lastPeakPos > minDist:
+            accepted.append(peak)
+            lastPeakPos = peak
+
+    return np.array(accepted, dtype=peaks.dtype)
@@ -0,0 +1,268 @@
+###########################################################################
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+'''
+Support for reading VDIF data recorded with the Mark6.
+
+VdifFile memory-maps a file and indexes its frame headers, so that any
+number of frames can be taken from any point of a scan without reading the
+file sequentially. writeSynthetic creates VDIF files for testing.
+'''
+
+import re
+from datetime import datetime, timedelta
+import numpy as np
+
+headerBytes = 32
+legacyHeaderBytes = 16
+
+# sample values of the 2-bit states (as used by mark5access)
+hiMag = 3.3359
+levels2bit = np.array([-hiMag, -1.0, 1.0, hiMag], dtype=np.float32)
+# integer representation of the 2-bit states
+levels2bitInt8 = np.array([-3, -1, 1, 3], dtype=np.int8)
+
+# lookup tables mapping a byte to its 4 samples (first sample in the least significant bits)
+lut2bitCodes = ((np.arange(256)[:, np.newaxis] >> np.array([0, 2, 4, 6])) & 3).astype(np.uint8)
+lut2bit = {
+    np.dtype(np.uint8): lut2bitCodes,
+    np.dtype(np.float32): levels2bit[lut2bitCodes],
+    np.dtype(np.int8): levels2bitInt8[lut2bitCodes],
+}
+
+reFormat = re.compile(r"VDIF_(\d+)-(\d+)-(\d+)-(\d+)$")
+
+# one entry per frame of the frame header index
+indexDtype = np.dtype([
+    ('offset', '<i8'),      # byte offset of the frame in the file
+    ('second', '<u4'),      # seconds since the reference epoch
+    ('frame', '<u4'),       # frame number within the second
+    ('epoch', 'u1'),        # reference epoch (half years since 2000)
+    ('thread', '<u2'),      # thread id
+    ('valid', '?'),         # False if the frame is flagged as invalid
+])
+
+
+def parseFormat(dataFormat):
+    '''
+    Parses a mark5access format string e.g. VDIF_5000-2048-16-2.
+    Returns a dict with the payload size [bytes], the total data rate [Mbps],
+    the number of channels and the number of bits per sample.
+    '''
+
+    match = reFormat.match(dataFormat)
+    if not match:
+        raise ValueError("Unsupported data format: %s" % dataFormat)
+
+    payload, rate, nchan, nbits = [int(v) for v in match.groups()]
+
+    return {'payload': payload, 'rate': rate, 'nchan': nchan, 'nbits': nbits}
+
+def sampleRate(fmt):
+    '''
+    Returns the sample rate per channel [samples/s] of a parsed format.
+    '''
+
+    return fmt['rate'] * 1e6 / (fmt['nchan'] * fmt['nbits'])
+
+def epochStart(epoch):
+    '''
+    Returns the start of a VDIF reference epoch (half years since 2000) as datetime.
+    '''
+
+    return datetime(2000 + epoch // 2, 1 + 6 * (epoch % 2), 1)
+
+
+class VdifFile:
+    '''
+    A memory-mapped VDIF file with a constant frame size.
+
+    The frame size and header type are taken from the first frame. The
+    header index is built on first use of index: only the header words of
+    each frame are touched, the payloads are not read.
+    '''
+
+    def __init__(self, path):
+
+        self.path = path
+        self.data = np.memmap(path, dtype=np.uint8, mode="r")
+        if self.data.size < legacyHeaderBytes:
+            raise ValueError("No VDIF frame found in %s" % path)
+
+        header = self.data[:legacyHeaderBytes].view("<u4")
+        self.frameBytes = int(header[2] & 0xffffff) * 8
+        self.headerBytes = legacyHeaderBytes if header[0] & (1 << 30) else headerBytes
+        self.numChannels = 1 << int((header[2] >> 24) & 0x1f)
+        self.bitsPerSample = int((header[3] >> 26) & 0x1f) + 1
+        if self.frameBytes <= self.headerBytes:
+            raise ValueError("Invalid VDIF frame size in %s" % path)
+
+        self.numFrames = self.data.size // self.frameBytes
+        self.frames = self.data[:self.numFrames * self.frameBytes].reshape(self.numFrames, self.frameBytes)
+        self._index = None
+
+    @property
+    def index(self):
+        '''
+        The frame header index as a structured array (see indexDtype).
+        '''
+
+        if self._index is None:
+            words = np.ascontiguousarray(self.frames[:, :legacyHeaderBytes]).view("<u4")
+            index = np.empty(self.numFrames, dtype=indexDtype)
+            index['offset'] = np.arange(self.numFrames, dtype=np.int64) * self.frameBytes
+            index['second'] = words[:, 0] & 0x3fffffff
+            index['frame'] = words[:, 1] & 0xffffff
+            index['epoch'] = (words[:, 1] >> 24) & 0x3f
+            index['thread'] = (words[:, 3] >> 16) & 0x3ff
+            index['valid'] = (words[:, 0] & (1 << 31)) == 0
+            self._index = index
+
+        return self._index
+
+    def threads(self):
+        return np.unique(self.index['thread'])
+
+    def framesPerSecond(self):
+        '''
+        Returns the number of frames per second and thread, derived from the
+        last frame number before the first change of the second. Returns
+        None if the file does not span a change of the second.
+        '''
+
+        second = self.index['second']
+        rollover = np.flatnonzero(second[1:] > second[:-1])
+        if len(rollover) == 0:
+            return None
+        return int(self.index['frame'][rollover[0]]) + 1
+
+    def time(self, frame):
+        '''
+        Returns the time stamp of the given frame as datetime. The fraction
+        of a second is only known if the file spans more than one second.
+        '''
+
+        entry = self.index[frame]
+        t = epochStart(int(entry['epoch'])) + timedelta(seconds=int(entry['second']))
+        fps = self.framesPerSecond()
+        if fps:
+            t += timedelta(seconds=float(entry['frame']) / fps)
+        return t
+
+    def findFrame(self, second, frame=0):
+        '''
+        Returns the position of the first frame at or after the given time
+        stamp (seconds since the reference epoch and frame number).
+        '''
+
+        index = self.index
+        key = index['second'].astype(np.int64) << 24 | index['frame']
+        return int(np.searchsorted(key, (int(second) << 24) | int(frame)))
+
+    def payloads(self, start=0, count=None, thread=None):
+        '''
+        Returns the payloads of count frames starting at frame start as a
+        2-D uint8 array (frames, payload bytes). For consecutive frames of
+        all threads the result is a zero-copy view of the memory map. If a
+        thread is selected, or invalid frames are present, only the valid
+        frames of the thread are returned as a copy.
+        '''
+
+        stop = self.numFrames if count is None else min(self.numFrames, start + count)
+        payloads = self.frames[start:stop, self.headerBytes:]
+
+        if thread is None and self.index['valid'][start:stop].all():
+            return payloads
+
+        select = self.index['valid'][start:stop]
+        if thread is not None:
+            select = select & (self.index['thread'][start:stop] == thread)
+        return payloads[select]
+
+    def close(self):
+        self.frames = None
+        self.data = None
+
+
+def unpack2bit(payload, nchan, dtype=np.uint8):
+    '''
+    Unpacks 2-bit samples using a lookup table. With the default dtype the
+    state codes 0..3 (--, -, +, ++) are returned, with float32 the sample
+    values (+-1, +-hiMag) and with int8 the values +-1, +-3.
+    Returns an array of shape (samples, nchan).
+    '''
+
+    try:
+        lut = lut2bit[np.dtype(dtype)]
+    except KeyError:
+        raise ValueError("Unsupported sample type: %s" % dtype)
+
+    payload = np.asarray(payload, dtype=np.uint8).ravel()
+
+    return lut[payload].reshape(-1, nchan)
+
+def decode2bit(payload, nchan, dtype=np.float32):
+    '''
+    Decodes 2-bit samples of nchan (1, 2, 4, 8 or 16) interleaved channels.
+    Returns a contiguous array of shape (nchan, samples) i.e. one row per
+    channel.
+    '''
+
+    if nchan not in (1, 2, 4, 8, 16):
+        raise ValueError("Unsupported number of channels: %d" % nchan)
+
+    return np.ascontiguousarray(unpack2bit(payload, nchan, dtype).T)
+
+
+def writeSynthetic(path, numFrames, payloadBytes=5000, numChannels=16, threads=1, second=0, epoch=0, framesPerSecond=None, tones=None, seed=0):
+    '''
+    Writes a 2-bit VDIF file with gaussian noise quantized at the optimum
+    thresholds. tones is an optional dict {channel: frequency} with the tone
+    frequencies in units of the sample rate (0..0.5). Frames of the threads
+    are interleaved. Returns the 2-bit state codes written, an array of
+    shape (threads, samples, channels).
+    '''
+
+    rng = np.random.default_rng(seed)
+    samplesPerFrame = payloadBytes * 8 // (numChannels * 2)
+    framesPerThread = -(-numFrames // threads)
+    numSamples = framesPerThread * samplesPerFrame
+
+    t = np.arange(numSamples)
+    codes = np.empty((threads, numSamples, numChannels), dtype=np.uint8)
+    for thread in range(threads):
+        x = rng.standard_normal((numSamples, numChannels)).astype(np.float32)
+        for channel, freq in (tones or {}).items():
+            x[:, channel] += 0.3 * np.sin(2 * np.pi * freq * t)
+        codes[thread] = np.digitize(x, [-0.9816, 0, 0.9816])
+
+    # pack 4 samples per byte, the first sample in the least significant bits
+    packed = codes.reshape(threads, -1, 4) << np.array([0, 2, 4, 6], dtype=np.uint8)
+    packed = np.bitwise_or.reduce(packed, axis=-1).reshape(threads, framesPerThread, payloadBytes)
+
+    if framesPerSecond is None:
+        framesPerSecond = framesPerThread
+
+    frameNum = np.arange(framesPerThread)
+    header = np.zeros((framesPerThread, threads, 8), dtype="<u4")
+    header[:, :, 0] = (second + frameNum // framesPerSecond)[:, np.newaxis]
+    header[:, :, 1] = ((epoch << 24) | (frameNum % framesPerSecond))[:, np.newaxis]
+    header[:, :, 2] = (int(np.log2(numChannels)) << 24) | ((payloadBytes + headerBytes) // 8)
+    header[:, :, 3] = (1 << 26) | (np.arange(threads, dtype=np.uint32) << 16)
+
+    frames = np.concatenate([header.view(np.uint8), packed.transpose(1, 0, 2)], axis=-1)
+    frames.reshape(-1, payloadBytes + headerBytes)[:numFrames].tofile(path)
+
+    return codes